@@ -0,0 +1,764 @@
+"""Offline benchmark of the crawl, publish and /fetch paths.
+
+Serves the recorded missav/onejav pages in bench_fixtures/ from a local
+server, fakes the Telegram and Telegraph APIs and replays bot commands
+through the real handlers in app.py. Prints a JSON report with throughput,
+latency percentiles, peak RSS and browser process count per workload.
+
+    python benchmark.py --output before.json
+    python benchmark.py --baseline before.json   # exits 1 on a regression
+
+Browsers are replaced by a fake crawler that fetches the same local pages
+after `--browser-latency` seconds; `--real-browser` uses crawl4ai instead.
+`--error-rate 0.2` answers a fifth of the page requests with 429s, and
+the host_concurrency_limit gauges in the report show the limiter backing off.
+"""
+import os
+import re
+import sys
+import json
+import math
+import time
+import random
+import asyncio
+import argparse
+import logging
+import resource
+import tempfile
+from string import Template
+from types import SimpleNamespace
+from html.parser import HTMLParser
+from urllib.parse import quote_plus, urljoin, urlparse
+import aiohttp
+from aiohttp import web
+
+logger = logging.getLogger("benchmark")
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+FIXTURES = os.path.join(ROOT, "bench_fixtures")
+# missav and onejav get their own loopback address, so the host limiter treats them as separate hosts
+MISSAV_HOST = "127.0.0.1"
+ONEJAV_HOST = "127.0.0.2"
+LISTING_PATH = "dm561/en/uncensored-leak"
+TELEGRAPH_CONTENT_LIMIT = 64 * 1024
+CHUNK_SIZE = 256 * 1024
+STUDIOS = ("abp", "ipx", "ssis", "midv", "sone", "jur", "pred", "start", "mide", "cawd")
+WORDS = (
+    "summer", "office", "after", "school", "secret", "weekend", "trip", "rainy", "night", "teacher",
+    "neighbor", "hotel", "room", "first", "time", "special", "edition", "private", "lesson", "reunion",
+)
+WORKLOADS = ("misstg", "crawl_missav", "moj", "builder", "fetch")
+
+
+# Fixture pages
+
+class Catalog:
+    """Deterministic releases the recorded page templates are rendered with."""
+
+    def __init__(self, missav_url, per_page=12, onejav_per_page=10):
+        self.missav_url = missav_url
+        self.per_page = per_page
+        self.onejav_per_page = onejav_per_page
+        self.templates = {}
+        for name in os.listdir(FIXTURES):
+            if name.endswith(".html"):
+                with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+                    self.templates[name[:-5]] = Template(f.read())
+
+    def render(self, name, **values):
+        return self.templates[name].substitute(missav=self.missav_url.rstrip("/"), **values)
+
+    def code(self, number):
+        return f"{STUDIOS[number % len(STUDIOS)]}-{number:03d}"
+
+    def title(self, code):
+        words = random.Random(code).sample(WORDS, 6)
+        return f"{code.upper()} {' '.join(words).capitalize()}"
+
+    def listing_codes(self, page):
+        start = 100 + (page - 1) * self.per_page
+        return [self.code(number) for number in range(start, start + self.per_page)]
+
+    def onejav_codes(self, page):
+        # Numbered apart from the listing pages so /moj and /misstg don't share detail pages
+        start = 5000 + (page - 1) * self.onejav_per_page
+        return [self.code(number).replace("-", "").upper() for number in range(start, start + self.onejav_per_page)]
+
+    def card(self, code):
+        return self.render("missav_card", code=code, title=self.title(code))
+
+    def listing(self, page):
+        cards = "\n".join(self.card(code) for code in self.listing_codes(page))
+        return self.render("missav_listing", page=page, prev=max(page - 1, 1), next=page + 1, cards=cards)
+
+    def detail(self, code, base):
+        title = self.title(code)
+        number = int(code.rsplit("-", 1)[-1])
+        related = "\n".join(self.card(self.code(number + offset)) for offset in range(1, 9))
+        return self.render(
+            "missav_detail", code=code, code_upper=code.upper(), title=title, title_q=quote_plus(title),
+            video=f"{base}video/{code}.mp4", description=f"{title}. " * 20 + related,
+        )
+
+    def search(self, term):
+        match = re.fullmatch(r"([A-Za-z]+)-?(\d+)", term)
+        if not match:
+            return self.render("missav_search", term=term, cards="")
+        studio, number = match.group(1).lower(), int(match.group(2))
+        # The release itself plus the next number, which the /moj match filter has to drop
+        codes = [f"{studio}-{number:03d}", f"{studio}-{number + 1:03d}"]
+        return self.render("missav_search", term=term, cards="\n".join(self.card(code) for code in codes))
+
+    def onejav(self, page):
+        cards = "\n".join(
+            self.render(
+                "onejav_card", code=code, code_lower=code.lower(), date="2024/01/01",
+                date_text="January 1, 2024", title=self.title(code),
+            )
+            for code in self.onejav_codes(page)
+        )
+        return self.render("onejav_listing", page=page, next=page + 1, cards=cards)
+
+
+class BenchServer:
+    """Local server for the fixture pages, video files and a fake Telegraph API.
+
+    With `error_rate`, that share of page requests is answered with
+    `error_status` (429 by default) instead, to see the host limiter back off.
+    """
+
+    PAGE_ROUTES = ("listing", "search", "detail", "onejav")
+
+    def __init__(self, latency=0.05, bandwidth=50 * 1024 ** 2, video_size=8 * 1024 ** 2, error_rate=0.0,
+                 error_status=429):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.video_size = video_size
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.port = None
+        self.catalog = None
+        self.requests = {}
+        self.errors = 0
+        self.pages = {}
+        self._random = random.Random(0)
+        self._runner = None
+
+    def url(self, host=MISSAV_HOST):
+        return f"http://{host}:{self.port}/"
+
+    async def start(self):
+        app = web.Application(middlewares=[self._count])
+        app.router.add_get(f"/{LISTING_PATH}", self.listing)
+        app.router.add_get("/en/search/{term}", self.search)
+        app.router.add_get("/en/{code}", self.detail)
+        app.router.add_get("/", self.onejav)
+        app.router.add_get("/new", self.onejav)
+        app.router.add_get("/video/{code}.mp4", self.video)
+        app.router.add_post("/telegraph/createAccount", self.create_account)
+        app.router.add_post("/telegraph/createPage", self.create_page)
+        app.router.add_post("/telegraph/editPage/{path}", self.edit_page)
+        app.router.add_post("/telegraph/getPage/{path}", self.get_page)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, MISSAV_HOST, 0).start()
+        self.port = self._runner.addresses[0][1]
+        await web.TCPSite(self._runner, ONEJAV_HOST, self.port).start()
+        self.catalog = Catalog(self.url())
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+    @web.middleware
+    async def _count(self, request, handler):
+        name = request.match_info.route.resource.canonical if request.match_info.route.resource else "404"
+        self.requests[name] = self.requests.get(name, 0) + 1
+        await asyncio.sleep(self.latency)
+        if self.error_rate and handler.__name__ in self.PAGE_ROUTES and self._random.random() < self.error_rate:
+            self.errors += 1
+            return web.Response(status=self.error_status, text="Injected error")
+        return await handler(request)
+
+    def _page(self, text):
+        return web.Response(text=text, content_type="text/html")
+
+    async def listing(self, request):
+        return self._page(self.catalog.listing(int(request.query.get("page", 1))))
+
+    async def search(self, request):
+        return self._page(self.catalog.search(request.match_info["term"]))
+
+    async def detail(self, request):
+        return self._page(self.catalog.detail(request.match_info["code"], self.url()))
+
+    async def onejav(self, request):
+        return self._page(self.catalog.onejav(int(request.query.get("page", 1))))
+
+    async def video(self, request):
+        # Content depends on the code, so the upload index does not dedupe different videos by hash
+        code = request.match_info["code"].encode()
+        chunk = (code + b"\0" * (1024 - len(code))) * (CHUNK_SIZE // 1024)
+        response = web.StreamResponse(headers={"Content-Type": "video/mp4"})
+        response.content_length = self.video_size
+        await response.prepare(request)
+        sent = 0
+        while sent < self.video_size:
+            data = chunk[:self.video_size - sent]
+            await response.write(data)
+            sent += len(data)
+            await asyncio.sleep(len(data) / self.bandwidth)
+        await response.write_eof()
+        return response
+
+    def _ok(self, result):
+        return web.json_response({"ok": True, "result": result})
+
+    async def create_account(self, request):
+        return self._ok({"short_name": "bench", "access_token": "bench-token"})
+
+    async def _save_page(self, path, request):
+        form = await request.post()
+        if len(form["content"].encode()) > TELEGRAPH_CONTENT_LIMIT:
+            return web.json_response({"ok": False, "error": "CONTENT_TOO_BIG"})
+        self.pages[path] = {"path": path, "title": form["title"], "content": json.loads(form["content"])}
+        return self._ok({"path": path, "url": f"https://graph.org/{path}", "title": form["title"]})
+
+    async def create_page(self, request):
+        return await self._save_page(f"bench-{len(self.pages) + 1}", request)
+
+    async def edit_page(self, request):
+        path = request.match_info["path"]
+        if path not in self.pages:
+            return web.json_response({"ok": False, "error": "PAGE_NOT_FOUND"})
+        return await self._save_page(path, request)
+
+    async def get_page(self, request):
+        page = self.pages.get(request.match_info["path"])
+        return self._ok(page) if page else web.json_response({"ok": False, "error": "PAGE_NOT_FOUND"})
+
+
+# Fake browser
+
+class PageParser(HTMLParser):
+    """Collects media and links shaped like crawl4ai's result; images get the text after them as `desc`."""
+
+    def __init__(self, base_url):
+        super().__init__(convert_charrefs=True)
+        self.base_url = base_url
+        self.host = urlparse(base_url).netloc.lower()
+        self.images, self.videos = [], []
+        self.links = {"internal": [], "external": []}
+        self.text = []
+        self._link = None
+        self._in_video = False
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "img" and (attrs.get("data-src") or attrs.get("src")):
+            src = urljoin(self.base_url, attrs.get("data-src") or attrs["src"])
+            self.images.append({"src": src, "alt": attrs.get("alt") or "", "desc": ""})
+        elif tag == "a" and attrs.get("href"):
+            self._link = {"href": urljoin(self.base_url, attrs["href"]), "text": ""}
+        elif tag == "video":
+            self._in_video = True
+        elif tag == "source" and self._in_video and attrs.get("src"):
+            self.videos.append({"src": urljoin(self.base_url, attrs["src"])})
+
+    def handle_endtag(self, tag):
+        if tag == "a" and self._link is not None:
+            self._link["text"] = self._link["text"].strip()
+            external = urlparse(self._link["href"]).netloc.lower() != self.host
+            self.links["external" if external else "internal"].append(self._link)
+            self._link = None
+        elif tag == "video":
+            self._in_video = False
+
+    def handle_data(self, data):
+        if not data.strip():
+            return
+        self.text.append(data.strip())
+        if self._link is not None:
+            self._link["text"] += data
+        if self.images and len(self.images[-1]["desc"]) < 200:
+            self.images[-1]["desc"] = (self.images[-1]["desc"] + " " + data.strip()).strip()
+
+
+class FakeCrawler:
+    """Stands in for AsyncWebCrawler: fetches the page over HTTP and waits like a browser would."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.session = None
+
+    async def start(self):
+        self.session = aiohttp.ClientSession()
+
+    async def close(self):
+        await self.session.close()
+
+    async def arun(self, url, **options):
+        await asyncio.sleep(self.latency)
+        try:
+            async with self.session.get(url) as response:
+                html = await response.text()
+                status = response.status
+        except aiohttp.ClientError as e:
+            return SimpleNamespace(success=False, status_code=None, error_message=str(e))
+        parser = PageParser(url)
+        parser.feed(html)
+        if options.get("exclude_external_links"):
+            parser.links["external"] = []
+        markdown = "\n".join(parser.text)
+        return SimpleNamespace(
+            success=status < 400, status_code=status, error_message=f"HTTP {status}", html=html,
+            media={"images": parser.images, "videos": parser.videos}, links=parser.links,
+            markdown=markdown, markdown_v2=None,
+        )
+
+
+# Fake Telegram
+
+class FakeMessage:
+    def __init__(self, client, chat_id, text="", command=None):
+        self.client = client
+        self.id = next(client.ids)
+        self.chat = SimpleNamespace(id=chat_id)
+        self.text = text
+        self.command = command
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        await asyncio.sleep(self.client.latency)
+        message = FakeMessage(self.client, self.chat.id, text)
+        self.client.messages[message.id] = message
+        self.replies.append(message)
+        return message
+
+    async def edit_text(self, text, **kwargs):
+        await self.client.edit_message_text(self.chat.id, self.id, text, **kwargs)
+
+    async def delete(self):
+        await self.client.delete_messages(self.chat.id, self.id)
+
+
+class FakeTelegram:
+    """The parts of a pyrogram Client the handlers and the job runner use, with simulated latency."""
+
+    def __init__(self, latency=0.05, bandwidth=50 * 1024 ** 2):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.ids = iter(range(1, 10 ** 9))
+        self.messages = {}
+        self.calls = {}
+
+    def _call(self, name):
+        self.calls[name] = self.calls.get(name, 0) + 1
+        return asyncio.sleep(self.latency)
+
+    def command(self, chat_id, *command):
+        return FakeMessage(self, chat_id, " ".join(command), list(command))
+
+    async def edit_message_text(self, chat_id, message_id, text, **kwargs):
+        await self._call("edit_message_text")
+        if message_id in self.messages:
+            self.messages[message_id].text = text
+
+    async def delete_messages(self, chat_id, message_ids):
+        await self._call("delete_messages")
+        self.messages.pop(message_ids, None)
+
+    async def send_video(self, chat_id, video, caption=None, progress=None, progress_args=(), **kwargs):
+        await self._call("send_video")
+        # A path is uploaded at `bandwidth`, a file_id is a re-send
+        if isinstance(video, str) and os.path.exists(video):
+            total = os.path.getsize(video)
+            sent = 0
+            while sent < total:
+                step = min(CHUNK_SIZE, total - sent)
+                await asyncio.sleep(step / self.bandwidth)
+                sent += step
+                if progress:
+                    await progress(sent, total, *progress_args)
+        return SimpleNamespace(video=SimpleNamespace(file_id=f"file-{next(self.ids)}"), document=None)
+
+    def rnd_id(self):
+        return random.getrandbits(63)
+
+
+# Measurements
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    # Nearest rank
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+class ProcessSampler:
+    """Samples the RSS of this process tree and its number of browser processes while a workload runs."""
+
+    def __init__(self, interval=0.2):
+        self.interval = interval
+        self.peak_rss = 0
+        self.peak_browsers = 0
+        self._task = None
+
+    @staticmethod
+    def _processes():
+        """`{pid: (ppid, name, rss_bytes)}` from /proc."""
+        processes = {}
+        page_size = os.sysconf("SC_PAGE_SIZE")
+        for entry in os.listdir("/proc"):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    stat = f.read()
+                with open(f"/proc/{entry}/statm") as f:
+                    rss = int(f.read().split()[1]) * page_size
+            except OSError:
+                continue
+            name = stat[stat.index("(") + 1:stat.rindex(")")]
+            ppid = int(stat[stat.rindex(")") + 2:].split()[1])
+            processes[int(entry)] = (ppid, name, rss)
+        return processes
+
+    def sample(self):
+        if not os.path.isdir("/proc"):
+            self.peak_rss = max(self.peak_rss, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024)
+            return
+        processes = self._processes()
+        tree, frontier = {os.getpid()}, [os.getpid()]
+        while frontier:
+            parent = frontier.pop()
+            children = [pid for pid, (ppid, _, _) in processes.items() if ppid == parent and pid not in tree]
+            tree.update(children)
+            frontier.extend(children)
+        rss = sum(processes[pid][2] for pid in tree if pid in processes)
+        browsers = sum(1 for pid in tree if pid in processes and "chrom" in processes[pid][1].lower())
+        self.peak_rss = max(self.peak_rss, rss)
+        self.peak_browsers = max(self.peak_browsers, browsers)
+
+    async def _run(self):
+        while True:
+            await asyncio.to_thread(self.sample)
+            await asyncio.sleep(self.interval)
+
+    def __enter__(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    def __exit__(self, *exc):
+        self._task.cancel()
+        self.sample()
+
+
+async def measure(name, workload):
+    """Run one workload, returning its report entry.
+
+    `workload()` returns `(latencies, items, errors)`: seconds per operation,
+    units of work done (entries, jobs...) and failed operations.
+    """
+    logger.info(f"Running {name}")
+    with ProcessSampler() as sampler:
+        started = time.monotonic()
+        latencies, items, errors = await workload()
+        seconds = time.monotonic() - started
+    return {
+        "operations": len(latencies),
+        "items": items,
+        "errors": errors,
+        "seconds": round(seconds, 3),
+        "throughput": round(items / seconds, 3) if seconds else None,
+        "latency": {f"p{q}": round(percentile(latencies, q), 4) if latencies else None for q in (50, 95, 99)},
+        "peak_rss_mb": round(sampler.peak_rss / 1024 ** 2, 1),
+        "peak_browsers": sampler.peak_browsers,
+    }
+
+
+async def timed(coroutine):
+    started = time.monotonic()
+    result = await coroutine
+    return time.monotonic() - started, result
+
+
+# Workloads
+
+class Bench:
+    def __init__(self, args, server, telegram, modules):
+        self.args = args
+        self.server = server
+        self.telegram = telegram
+        self.app, self.crawl, self.downloader, self.publish = modules
+        self.cache_flags = [] if args.cache else ["--nocache"]
+        self.chats = iter(range(1000, 10 ** 6))
+
+    def detail_links(self, count):
+        codes = [code for page in range(1, count // self.server.catalog.per_page + 2)
+                 for code in self.server.catalog.listing_codes(page)]
+        return [f"{self.server.url()}en/{code}" for code in codes[:count]]
+
+    async def job(self, handler, *command):
+        """Send a command and wait for the job it queued to reach a final state. Returns its seconds and row.
+
+        A command turned away by a full queue counts as a job in the "rejected" state.
+        """
+        from jobs import FINAL_STATES
+        started = time.monotonic()
+        message = self.telegram.command(next(self.chats), *command, *self.cache_flags)
+        await handler(self.telegram, message)
+        queued = re.search(r"job (\w+)", message.replies[0].text)
+        if not queued:
+            return time.monotonic() - started, {"state": "rejected", "result": None}
+        job_id = queued.group(1)
+        while (row := self.downloader.job_store.get(job_id))["state"] not in FINAL_STATES:
+            await asyncio.sleep(0.05)
+        return time.monotonic() - started, row
+
+    async def misstg(self):
+        """`/misstg <listing> <pages>`, run `--repeat` times one after another."""
+        base = f"{self.server.url()}{LISTING_PATH}"
+        latencies, items, errors = [], 0, 0
+        for _ in range(self.args.repeat):
+            seconds, row = await self.job(self.app.misstg_command, "/misstg", base, str(self.args.pages))
+            latencies.append(seconds)
+            if row["state"] == "done" and row["result"].startswith("✅"):
+                items += self.args.pages * self.server.catalog.per_page
+            else:
+                errors += 1
+        return latencies, items, errors
+
+    async def crawl_missav(self):
+        """`--crawls` concurrent crawl_missav calls on distinct detail pages."""
+        links = self.detail_links(self.args.crawls)
+        results = await asyncio.gather(*(
+            timed(self.crawl.crawl_missav(link, use_cache=self.args.cache)) for link in links
+        ))
+        return [seconds for seconds, _ in results], len(links), sum(1 for _, data in results if not data)
+
+    async def moj(self):
+        """moj() over `--moj-pages` onejav pages, run `--repeat` times."""
+        latencies, items, errors = [], 0, 0
+        for _ in range(self.args.repeat):
+            seconds, batch = await timed(self.crawl.moj(pages=self.args.moj_pages, refresh=True,
+                                                       use_cache=self.args.cache))
+            latencies.append(seconds)
+            items += len(batch)
+            errors += len(batch) != self.args.moj_pages * self.server.catalog.onejav_per_page
+        return latencies, items, errors
+
+    async def builder(self):
+        """NodeBuilder over `--entries` entries and paginate(), run `--repeat` times."""
+        from entries import VideoEntry
+        catalog = self.server.catalog
+        entries = [
+            VideoEntry(catalog.title(code), f"https://fivetiu.com/{code}/cover-t.jpg", f"{catalog.missav_url}en/{code}",
+                       code=code, video=f"https://surrit.com/{code}/playlist.m3u8")
+            for code in map(catalog.code, range(self.args.entries))
+        ]
+        latencies = []
+        for _ in range(self.args.repeat):
+            started = time.monotonic()
+            builder = self.publish.NodeBuilder()
+            for entry in entries:
+                builder.add(entry)
+            builder.paginate()
+            latencies.append(time.monotonic() - started)
+        return latencies, len(entries) * self.args.repeat, 0
+
+    async def fetch(self):
+        """`--jobs` concurrent `/fetch <link>` commands, each timed until its job reaches a final state."""
+        links = self.detail_links(self.args.jobs)
+        results = await asyncio.gather(*(self.job(self.app.fetch_command, "/fetch", link) for link in links))
+        # A job is marked done before it cleans up its status message and files
+        while self.downloader.job_runner.jobs:
+            await asyncio.sleep(0.05)
+        return [seconds for seconds, _ in results], len(links), sum(1 for _, row in results if row["state"] != "done")
+
+
+def stub_download(downloader, session):
+    async def download_video(video_url, title, job=None, progress=None):
+        """Stands in for yt-dlp: streams the video from the bench server into DOWNLOAD_DIR."""
+        os.makedirs(downloader.DOWNLOAD_DIR, exist_ok=True)
+        path = os.path.join(downloader.DOWNLOAD_DIR, f"{title}.mp4")
+        async with downloader.download_slots:
+            async with session.get(video_url) as response:
+                response.raise_for_status()
+                done = 0
+                with open(path, "wb") as f:
+                    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                        f.write(chunk)
+                        done += len(chunk)
+                        if progress:
+                            progress(done, response.content_length)
+        return path
+
+    async def generate_thumbnail(video_path, output_path, timestamp=None, job=None):
+        pass
+
+    downloader.download_video = download_video
+    downloader.generate_thumbnail = generate_thumbnail
+
+
+def compare(report, baseline, threshold):
+    """Per-workload changes against a baseline report, and the workloads that regressed beyond `threshold`."""
+    changes, regressions = {}, []
+    for name, current in report["workloads"].items():
+        previous = baseline.get("workloads", {}).get(name)
+        if not previous:
+            continue
+        change = {}
+        if previous.get("throughput") and current.get("throughput") is not None:
+            change["throughput"] = round(current["throughput"] / previous["throughput"] - 1, 4)
+        for q, value in current["latency"].items():
+            if value is not None and previous["latency"].get(q):
+                change[f"latency_{q}"] = round(value / previous["latency"][q] - 1, 4)
+        changes[name] = change
+        if change.get("throughput", 0) < -threshold or change.get("latency_p95", 0) > threshold:
+            regressions.append(name)
+    return changes, regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark of the crawl, publish and /fetch paths.")
+    parser.add_argument("--workloads", default=",".join(WORKLOADS),
+                        help=f"Comma-separated workloads to run (default: all of {', '.join(WORKLOADS)})")
+    parser.add_argument("--pages", type=int, default=10, help="Listing pages per /misstg")
+    parser.add_argument("--moj-pages", type=int, default=3, help="onejav pages per moj() run")
+    parser.add_argument("--crawls", type=int, default=50, help="Concurrent crawl_missav calls")
+    parser.add_argument("--jobs", type=int, default=20, help="Concurrent /fetch jobs")
+    parser.add_argument("--workers", type=int, default=4, help="Job workers (JOB_WORKERS) running the queued commands")
+    parser.add_argument("--entries", type=int, default=5000, help="Entries fed to the NodeBuilder")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of the sequential workloads")
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds added to every local page request")
+    parser.add_argument("--browser-latency", type=float, default=1.0, help="Seconds a fake browser crawl takes")
+    parser.add_argument("--telegram-latency", type=float, default=0.05, help="Seconds per fake Telegram API call")
+    parser.add_argument("--bandwidth", type=float, default=50, help="Download and upload speed in MB/s")
+    parser.add_argument("--video-size", type=float, default=8, help="Size of the served videos in MB")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="Share of page requests the server answers with --error-status (e.g. 0.2)")
+    parser.add_argument("--error-status", type=int, default=429, help="HTTP status of the injected errors")
+    parser.add_argument("--cache", action="store_true", help="Keep the crawl cache on (default: every run crawls)")
+    parser.add_argument("--real-browser", action="store_true", help="Crawl with crawl4ai browsers instead of the fake")
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    parser.add_argument("--baseline", help="Earlier report to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="Relative throughput drop or p95 rise counted as a regression")
+    return parser.parse_args(argv)
+
+
+def configure(args, server, workdir):
+    """Point the bot's configuration at the bench server before its modules are imported."""
+    os.environ.update({
+        "MISSAV_URL": server.url(MISSAV_HOST),
+        "ONEJAV_URL": server.url(ONEJAV_HOST),
+        "TELEGRAPH_API_URL": f"{server.url()}telegraph/",
+        "TELEGRAPH_ACCESS_TOKEN": "",
+        "METRICS_PORT": "0",
+        "METRICS_LOG_INTERVAL": "0",
+        "TELEGRAM_API_ID": "1",
+        "TELEGRAM_API_HASH": "bench",
+        "TELEGRAM_BOT_TOKEN": "1:bench",
+        "JOB_WORKERS": str(args.workers),
+    })
+    # Local pages answer in milliseconds; export HOST_RATE to benchmark with the production limit
+    os.environ.setdefault("HOST_RATE", "50")
+    os.environ.setdefault("HOST_BURST", "20")
+    # Caches, the job database and downloads are created relative to the working directory
+    os.chdir(workdir)
+    sys.path.insert(0, ROOT)
+
+
+async def run(args):
+    server = BenchServer(args.latency, args.bandwidth * 1024 ** 2, int(args.video_size * 1024 ** 2),
+                         args.error_rate, args.error_status)
+    await server.start()
+    workdir = tempfile.TemporaryDirectory(prefix="crawl4tg-bench-")
+    configure(args, server, workdir.name)
+
+    import app
+    import crawl
+    import publish
+    import downloader
+    from commands import JOB_HANDLERS
+    from metrics import metrics
+    from pool import CrawlerPool
+
+    if not args.real_browser:
+        class FakeCrawlerPool(CrawlerPool):
+            async def _new_crawler(self):
+                crawler = FakeCrawler(args.browser_latency)
+                await crawler.start()
+                self._uses[crawler] = 0
+                return crawler
+
+        crawl.crawler_pool = FakeCrawlerPool()
+    session = aiohttp.ClientSession()
+    stub_download(downloader, session)
+    telegram = FakeTelegram(args.telegram_latency, args.bandwidth * 1024 ** 2)
+    bench = Bench(args, server, telegram, (app, crawl, downloader, publish))
+
+    report = {
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "workloads": {},
+    }
+    # Commands only queue jobs; the runner works through them as the bot's own workers would
+    await downloader.job_runner.start(telegram, JOB_HANDLERS)
+    try:
+        for name in args.workloads.split(","):
+            if name not in WORKLOADS:
+                raise SystemExit(f"Unknown workload {name!r}, choose from {', '.join(WORKLOADS)}")
+            report["workloads"][name] = await measure(name, getattr(bench, name))
+    finally:
+        await downloader.job_runner.stop()
+        await crawl.shutdown()
+        await publish.publisher.close()
+        await session.close()
+        await server.stop()
+        os.chdir(ROOT)
+        workdir.cleanup()
+
+    usage, children = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+    report["max_rss_mb"] = round(usage.ru_maxrss / 1024, 1)
+    report["max_child_rss_mb"] = round(children.ru_maxrss / 1024, 1)
+    report["requests"] = server.requests
+    report["injected_errors"] = server.errors
+    report["telegram_calls"] = telegram.calls
+    report["metrics"] = metrics.summary()
+    return report
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # The run happens in a temporary working directory
+    for name in ("output", "baseline"):
+        if getattr(args, name):
+            setattr(args, name, os.path.abspath(getattr(args, name)))
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    logger.setLevel(logging.INFO)
+    report = asyncio.run(run(args))
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["changes"], regressions = compare(report, json.load(f), args.threshold)
+        report["regressions"] = regressions
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+        logger.info(f"Report written to {args.output}")
+    else:
+        print(text)
+    if regressions:
+        logger.warning(f"Regressed beyond {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from metrics import metrics
+from tracing import tracer
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+logger = logging.getLogger(__name__)
+
+cache_requests = metrics.counter("cache_requests_total", "Crawl cache lookups by kind and result")
+
+DB_PATH = os.path.join(os.getcwd(), 'crawler_cache', 'crawler_cache.db')
+CACHE_TTL = int(os.getenv('CACHE_TTL', 24 * 60 * 60))
+LISTING_CACHE_TTL = int(os.getenv('LISTING_CACHE_TTL', 15 * 60))
+NEGATIVE_CACHE_TTL = int(os.getenv('NEGATIVE_CACHE_TTL', 60 * 60))
+
+# Trailing command arguments that control the cache
+REFRESH_FLAGS = {"--refresh", "refresh"}
+BYPASS_FLAGS = {"--nocache", "nocache"}
+
+
+def normalize_url(url):
+    """Canonical form of a URL used as the cache key."""
+    parts = urlsplit(url.strip())
+    path = parts.path.rstrip("/") or "/"
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, query, ""))
+
+
+def parse_cache_flags(args):
+    """Split cache flags off a command's arguments.
+
+    Returns `(args, refresh, use_cache)`: `refresh` skips the cache read but
+    stores the fresh result, `use_cache=False` neither reads nor writes.
+    """
+    refresh = any(arg.lower() in REFRESH_FLAGS for arg in args)
+    use_cache = not any(arg.lower() in BYPASS_FLAGS for arg in args)
+    args = [arg for arg in args if arg.lower() not in REFRESH_FLAGS | BYPASS_FLAGS]
+    return args, refresh, use_cache
+
+
+class CrawlCache:
+    """Result cache on top of the `crawled_data` table.
+
+    `content` holds the extracted data as JSON (not raw HTML). A stored
+    value of `None` is a negative entry ("nothing found"), which expires
+    after NEGATIVE_CACHE_TTL instead of the regular TTL.
+    """
+
+    MISS = object()
+
+    def __init__(self, db_path=DB_PATH):
+        self.db_path = db_path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS crawled_data (
+                    url TEXT PRIMARY KEY,
+                    content TEXT,
+                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            self._conn.commit()
+        return self._conn
+
+    @staticmethod
+    def key(kind, url):
+        return f"{kind}:{normalize_url(url)}"
+
+    def get(self, kind, url, ttl=CACHE_TTL):
+        """Return the cached value, or `CrawlCache.MISS` if absent or expired."""
+        with tracer.span("cache.get", kind=kind) as span:
+            try:
+                with self._lock:
+                    row = self._connect().execute(
+                        "SELECT content, strftime('%s', timestamp) FROM crawled_data WHERE url = ?",
+                        (self.key(kind, url),)
+                    ).fetchone()
+            except sqlite3.Error as e:
+                logger.error(f"Cache read error for {url}: {e}")
+                return self.MISS
+            if not row:
+                cache_requests.inc(kind=kind, result="miss")
+                span.set(result="miss")
+                return self.MISS
+            value = json.loads(row[0])
+            age = time.time() - int(row[1])
+            if age > (NEGATIVE_CACHE_TTL if value is None else ttl):
+                cache_requests.inc(kind=kind, result="expired")
+                span.set(result="expired")
+                return self.MISS
+            cache_requests.inc(kind=kind, result="hit")
+            span.set(result="hit")
+            return value
+
+    def set(self, kind, url, value):
+        try:
+            with self._lock:
+                conn = self._connect()
+                conn.execute(
+                    "INSERT OR REPLACE INTO crawled_data (url, content, timestamp) VALUES (?, ?, CURRENT_TIMESTAMP)",
+                    (self.key(kind, url), json.dumps(value))
+                )
+                conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Cache write error for {url}: {e}")
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class StateStore:
+    """Small persistent key/value store for bot bookkeeping (e.g. crawl high-water marks)."""
+
+    def __init__(self, db_path=DB_PATH):
+        self.db_path = db_path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS bot_state (
+                    key TEXT PRIMARY KEY,
+                    value TEXT,
+                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            self._conn.commit()
+        return self._conn
+
+    def get(self, key, default=None):
+        with self._lock:
+            row = self._connect().execute("SELECT value FROM bot_state WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set(self, key, value):
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO bot_state (key, value, timestamp) VALUES (?, ?, CURRENT_TIMESTAMP)",
+                (key, json.dumps(value))
+            )
+            conn.commit()
@@ -0,0 +1,167 @@
+import asyncio
+import logging
+import functools
+from functools import partial
+from crawl import detail_pool, fetch_pages, crawl_missav, simple_crawl, resolve_detail, moj_stream
+from publish import publisher, NodeBuilder
+from status_progress import ProgressReporter
+from downloader import StatusMessage, QueueFull, fetch_video, job_runner, new_job_id
+
+logger = logging.getLogger(__name__)
+
+
+class JobFailed(Exception):
+    """Ends a command job as failed, with the message shown to the user."""
+
+
+def failed_pages(errors):
+    if not errors:
+        return ""
+    return "\n\n⚠️ Failed pages: " + ", ".join(f"{page} ({error})" for page, error in errors.items())
+
+
+def command_job(stage, failure):
+    """Decorator turning `run(job, status)` into a job handler.
+
+    The status message shows `stage` once a worker picks the job up and
+    is replaced by the text `run` returns, which is also stored as the
+    job's result. Raise `JobFailed` to fail with a specific message;
+    other errors show `failure`.
+    """
+    def decorator(run):
+        @functools.wraps(run)
+        async def handler(client, job):
+            status = ProgressReporter(StatusMessage(client, job.chat_id, job.status_message_id), stage=stage)
+            await job.set_state("running")
+            status.update()
+            try:
+                result = await run(job, status)
+            except asyncio.CancelledError:
+                if job.state == "cancelled":
+                    await status.finish(f"🛑 Job {job.id} cancelled.")
+                raise
+            except JobFailed as e:
+                await job.set_state("failed", error=str(e))
+                await status.finish(str(e), disable_web_page_preview=True)
+                return
+            except Exception as e:
+                logger.error(f"Error in /{job.kind} job {job.id}: {e}")
+                await job.set_state("failed", error=str(e))
+                await status.finish(failure)
+                return
+            await job.set_state("done", result=result)
+            await status.finish(result, disable_web_page_preview=True)
+        return handler
+    return decorator
+
+
+# Fetch MissAV links from listing pages
+@command_job("🔄 Fetching MissAV links...", "❌ Failed to fetch links. Please try again.")
+async def miss_job(job, status):
+    links, errors = await fetch_pages(
+        job.link, end_page=job.payload["pages"], refresh=job.refresh, use_cache=job.use_cache,
+        progress=lambda done, total: status.update(pages=(done, total)),
+    )
+    formatted_links = "\n".join([f"{i + 1}. {entry.title}" for i, entry in enumerate(links)])
+    return f"📄 Links fetched:\n\n{formatted_links}{failed_pages(errors)}"
+
+
+# Fetch MissAV links, resolve their videos and publish them to Telegraph
+@command_job("🔄 Fetching MissAV links...", "❌ Failed to fetch links. Please try again.")
+async def misstg_job(job, status):
+    links, errors = await fetch_pages(
+        job.link, end_page=job.payload["pages"], refresh=job.refresh, use_cache=job.use_cache,
+        progress=lambda done, total: status.update(pages=(done, total)),
+    )
+    if not links:
+        raise JobFailed(f"❌ No links found.{failed_pages(errors)}")
+    # Resolve detail pages on the worker pool; results arrive in listing order
+    resolve = partial(resolve_detail, refresh=job.refresh, use_cache=job.use_cache)
+    builder = NodeBuilder()
+    status.update("🔎 Resolving videos...", resolved=(0, len(links)))
+    async for entry, data, error in detail_pool.run(resolve, links):
+        if error:
+            logger.error(f"Error resolving {entry.url}: {error}")
+        entry.video = data[-1] if data else ""
+        builder.add(entry)
+        status.update(resolved=(len(builder), len(links)))
+
+    # Publish to Telegraph, split over linked pages when it is too big for one
+    status.update("📤 Publishing to Telegraph...")
+    urls = await publisher.publish("MissAV Links", builder)
+    telegraph_url = urls[0] + (f" ({len(urls)} pages)" if len(urls) > 1 else "")
+    return f"✅ Links fetched! View them here:\n\n{telegraph_url}{failed_pages(errors)}"
+
+
+# Find new onejav releases on MissAV and publish them to Telegraph
+@command_job("🔄 Fetching OneJav links...", "❌ An error occurred while processing your request.")
+async def mojtg_job(job, status):
+    # Matches stream out of the moj pipeline and go straight into the Telegraph content
+    builder = NodeBuilder(heading="code")
+    async for entry in moj_stream(job.payload["pages"], refresh=job.refresh, use_cache=job.use_cache):
+        builder.add(entry)
+        status.update(found=len(builder))
+    if not builder:
+        raise JobFailed("❌ No new links found since the last run. Try again later, or add --refresh.")
+
+    status.update("📤 Publishing to Telegraph...")
+    urls = await publisher.publish("OneJav Links", builder)
+    telegraph_url = urls[0] + (f" ({len(urls)} pages)" if len(urls) > 1 else "")
+    return f"✅ Links fetched! View them here:\n\n{telegraph_url}"
+
+
+# Crawl any link to markdown
+@command_job("🔄 Fetching...", "❌ Failed to crawl the link.")
+async def crawl_job(job, status):
+    result = await simple_crawl(job.link, refresh=job.refresh, use_cache=job.use_cache)
+    return f"📄 Data Fetched:\n\n{result}"
+
+
+# Title and video URL of a MissAV link
+@command_job("🔄 Fetching details for the given link...", "❌ Failed to fetch the link.")
+async def linkfetch_job(job, status):
+    data = await crawl_missav(job.link, refresh=job.refresh, use_cache=job.use_cache)
+    if not data:
+        raise JobFailed("❌ No video found for the given link.")
+    return f"Title: {data[0]}\nUrl: {data[-1]}"
+
+
+@command_job("🔄 Fetching details for the given link...", "❌ Failed to fetch the link.")
+async def rawfetch_job(job, status):
+    video = await crawl_missav(job.link, refresh=job.refresh, use_cache=job.use_cache)
+    if not video:
+        raise JobFailed("❌ No video found for the given link.")
+    return f"📄 Video URL:\n{video}"
+
+
+# Job kind -> handler, for the bot's JobRunner and worker.py
+JOB_HANDLERS = {
+    "fetch": fetch_video,
+    "miss": miss_job,
+    "misstg": misstg_job,
+    "mojtg": mojtg_job,
+    "crawl": crawl_job,
+    "linkfetch": linkfetch_job,
+    "rawfetch": rawfetch_job,
+}
+
+
+async def enqueue(message, kind, link="", refresh=False, use_cache=True, priority=0, stream=False, **payload):
+    """Reply with a status message and queue the job that will report on it.
+
+    Returns the job, or None if the queue is too full to take it, which
+    the reply says instead.
+    """
+    user_id = getattr(getattr(message, "from_user", None), "id", None) or message.chat.id
+    try:
+        position = await job_runner.admit(user_id, kind, priority, payload)
+    except QueueFull as e:
+        await message.reply_text(str(e))
+        return None
+    # The id is known before the reply, so a worker picking the job up at once can't be overwritten by it
+    job_id = new_job_id()
+    status_message = await message.reply_text(f"🕒 Queued as job {job_id}, position {position} (/cancel {job_id})")
+    return await job_runner.submit(
+        link, message.chat.id, status_message.id, priority, refresh=refresh, use_cache=use_cache, stream=stream,
+        kind=kind, payload=payload, id=job_id, user_id=user_id,
+    )
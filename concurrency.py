@@ -0,0 +1,360 @@
+import os
+import time
+import asyncio
+import collections
+import random
+import logging
+from contextlib import asynccontextmanager
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+HOST_CONCURRENCY = int(os.getenv('HOST_CONCURRENCY', 4))  # Starting concurrency per host
+HOST_MAX_CONCURRENCY = int(os.getenv('HOST_MAX_CONCURRENCY', 12))
+HOST_RATE = float(os.getenv('HOST_RATE', 2))  # Requests per second per host
+HOST_BURST = int(os.getenv('HOST_BURST', 4))
+# Crawls slower than this don't raise the concurrency
+HOST_LATENCY_TARGET = float(os.getenv('HOST_LATENCY_TARGET', 15))
+BACKOFF_FACTOR = 0.5
+BACKOFF_COOLDOWN = 2.0  # A burst of failures only halves the limit once
+
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second on average, bursts of up to `burst`.
+
+    Waiters are served in arrival order.
+    """
+
+    def __init__(self, rate=HOST_RATE, burst=HOST_BURST):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class AdaptiveLimit:
+    """Concurrency limit that adapts AIMD-style.
+
+    Each healthy request (succeeded within the latency target) raises the
+    limit by 1/limit, so about +1 per round trip; a throttled or failed
+    request halves it, at most once per BACKOFF_COOLDOWN.
+    """
+
+    def __init__(self, initial=HOST_CONCURRENCY, minimum=1, maximum=HOST_MAX_CONCURRENCY,
+                 latency_target=HOST_LATENCY_TARGET):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_target = latency_target
+        self.in_flight = 0
+        self._last_backoff = 0
+        self._waiters = collections.deque()
+
+    async def acquire(self):
+        while self.in_flight >= int(self.limit):
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                elif not waiter.cancelled():
+                    # Woken and cancelled at once: pass the free place on
+                    self._wake()
+                raise
+        self.in_flight += 1
+
+    def _wake(self):
+        for _ in range(max(0, int(self.limit) - self.in_flight)):
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                if not waiter.done():
+                    waiter.set_result(None)
+                    break
+
+    def release(self, ok, latency):
+        """`ok` is None for a request that was abandoned, which doesn't move the limit."""
+        self.in_flight -= 1
+        now = time.monotonic()
+        if ok is False:
+            if now - self._last_backoff > BACKOFF_COOLDOWN:
+                self._last_backoff = now
+                self.limit = max(self.minimum, self.limit * BACKOFF_FACTOR)
+                logger.info(f"Backing off to {int(self.limit)} concurrent requests")
+        elif ok and latency <= self.latency_target:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+        self._wake()
+
+
+class Slot:
+    """Outcome of one request made under `HostLimiter.slot()`."""
+
+    def __init__(self):
+        self.ok = True
+
+    def record(self, result):
+        """Judge a crawl4ai result: 429, 5xx and failures without a status count as throttling."""
+        status = getattr(result, "status_code", None)
+        if status is None and not result.success:
+            self.ok = False
+        else:
+            self.record_status(status)
+
+    def record_status(self, status):
+        """Judge a plain HTTP response status: 429 and 5xx count as throttling."""
+        if status == 429 or (status or 0) >= 500:
+            self.ok = False
+
+
+class HostLimiter:
+    """Rate limit and adaptive concurrency limit per host.
+
+    A request waits for a token of the host's `TokenBucket`, then for room
+    under its `AdaptiveLimit`. Exceptions (including timeouts) and results
+    marked with `Slot.record()` as throttled make the host back off.
+    """
+
+    def __init__(self, initial=HOST_CONCURRENCY, maximum=HOST_MAX_CONCURRENCY, rate=HOST_RATE, burst=HOST_BURST):
+        self.initial = initial
+        self.maximum = maximum
+        self.rate = rate
+        self.burst = burst
+        self._hosts = {}
+
+    def _host(self, url):
+        host = urlparse(url).netloc.lower()
+        if host not in self._hosts:
+            self._hosts[host] = (TokenBucket(self.rate, self.burst), AdaptiveLimit(self.initial, maximum=self.maximum))
+        return self._hosts[host]
+
+    def limits(self):
+        """Current concurrency limit and in-flight requests per host."""
+        return {host: (limit.limit, limit.in_flight) for host, (_, limit) in self._hosts.items()}
+
+    @asynccontextmanager
+    async def slot(self, url):
+        bucket, limit = self._host(url)
+        await bucket.acquire()
+        await limit.acquire()
+        slot = Slot()
+        started = time.monotonic()
+        try:
+            yield slot
+        except asyncio.CancelledError:
+            slot.ok = None
+            raise
+        except Exception:
+            slot.ok = False
+            raise
+        finally:
+            limit.release(slot.ok, time.monotonic() - started)
+
+
+async def gather_ordered(func, items):
+    """Run `func(item)` for every item concurrently.
+
+    Returns a list of `(item, result, error)` tuples in the order of `items`,
+    so one failing item does not hide the results of the others.
+    """
+    items = list(items)
+    outcomes = await asyncio.gather(*(func(item) for item in items), return_exceptions=True)
+    return [
+        (item, None, outcome) if isinstance(outcome, Exception) else (item, outcome, None)
+        for item, outcome in zip(items, outcomes)
+    ]
+
+
+DETAIL_WORKERS = int(os.getenv('DETAIL_WORKERS', 4))
+TASK_TIMEOUT = float(os.getenv('TASK_TIMEOUT', 90))
+TASK_RETRIES = int(os.getenv('TASK_RETRIES', 2))
+
+
+class WorkerPool:
+    """Runs a coroutine function over many items with a fixed number of workers.
+
+    Each attempt is bounded by `timeout` seconds and failed attempts are
+    retried up to `retries` times with exponential backoff. `run` yields
+    `(item, result, error)` tuples in input order as soon as the next one
+    in line is done, so consumers can start on early results while later
+    items are still being resolved.
+    """
+
+    def __init__(self, workers=DETAIL_WORKERS, timeout=TASK_TIMEOUT, retries=TASK_RETRIES, backoff=1.0):
+        self.workers = workers
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+
+    async def _attempt(self, func, item):
+        for attempt in range(self.retries + 1):
+            try:
+                return await asyncio.wait_for(func(item), self.timeout)
+            except Exception as e:
+                if attempt == self.retries:
+                    raise
+                delay = self.backoff * 2 ** attempt * (1 + random.random())
+                logger.warning(f"Attempt {attempt + 1} failed for {item!r}: {e!r}, retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def run(self, func, items):
+        items = list(items)
+        queue = asyncio.Queue()
+        for index, item in enumerate(items):
+            queue.put_nowait((index, item))
+        done = {}
+        ready = asyncio.Condition()
+
+        async def worker():
+            while True:
+                try:
+                    index, item = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                try:
+                    outcome = (item, await self._attempt(func, item), None)
+                except Exception as e:
+                    outcome = (item, None, e)
+                async with ready:
+                    done[index] = outcome
+                    ready.notify_all()
+
+        tasks = [asyncio.create_task(worker()) for _ in range(min(self.workers, len(items)))]
+        try:
+            for index in range(len(items)):
+                async with ready:
+                    await ready.wait_for(lambda: index in done)
+                    outcome = done.pop(index)
+                yield outcome
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key into one in-flight task.
+
+    Callers that arrive while a call for their key is running await the
+    same task instead of starting their own. The task is only cancelled
+    when every caller waiting on it has been cancelled.
+    """
+
+    def __init__(self):
+        self._inflight = {}
+
+    def __contains__(self, key):
+        return key in self._inflight
+
+    async def do(self, key, func, *args, **kwargs):
+        entry = self._inflight.get(key)
+        if entry is None:
+            task = asyncio.ensure_future(func(*args, **kwargs))
+            entry = self._inflight[key] = [task, 0]
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        task = entry[0]
+        entry[1] += 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and not task.done():
+                task.cancel()
+
+
+PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', 16))
+
+
+class Pipeline:
+    """Chains async stages through bounded queues.
+
+    Each stage is `(name, func, workers)`, where `func(item)` returns an
+    iterable of items for the next stage (empty to drop the item). Every
+    stage runs its own number of workers, queues between stages hold at
+    most `queue_size` items so a fast stage waits for a slow one, and
+    `run` takes a plain or async iterable of inputs and yields the outputs
+    of the last stage as soon as they are produced. An item whose stage
+    raises is logged, dropped and counted in `failed`; if the inputs
+    raise, the items already taken still go through and `run` then raises
+    the error.
+    """
+
+    _DONE = object()
+
+    def __init__(self, *stages, queue_size=PIPELINE_QUEUE_SIZE):
+        self.stages = stages
+        self.queue_size = queue_size
+        self.failed = 0
+
+    async def _stage_worker(self, name, func, inbox, outbox, remaining, downstream_workers):
+        while True:
+            item = await inbox.get()
+            if item is self._DONE:
+                break
+            try:
+                for output in await func(item):
+                    await outbox.put(output)
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Pipeline stage {name} failed for {item!r}: {e}")
+        # The last worker of a stage tells every downstream worker to stop
+        remaining[0] -= 1
+        if remaining[0] == 0:
+            for _ in range(downstream_workers):
+                await outbox.put(self._DONE)
+
+    async def run(self, items):
+        queues = [asyncio.Queue(self.queue_size) for _ in range(len(self.stages) + 1)]
+        tasks = []
+        for index, (name, func, workers) in enumerate(self.stages):
+            downstream = self.stages[index + 1][2] if index + 1 < len(self.stages) else 1
+            remaining = [workers]
+            tasks += [
+                asyncio.create_task(
+                    self._stage_worker(name, func, queues[index], queues[index + 1], remaining, downstream)
+                )
+                for _ in range(workers)
+            ]
+
+        async def feed():
+            # The stages are shut down even when the source fails, so run() can finish and raise its error
+            error = None
+            try:
+                if hasattr(items, "__aiter__"):
+                    async for item in items:
+                        await queues[0].put(item)
+                else:
+                    for item in items:
+                        await queues[0].put(item)
+            except Exception as e:
+                error = e
+            for _ in range(self.stages[0][2]):
+                await queues[0].put(self._DONE)
+            if error:
+                raise error
+
+        feeder = asyncio.create_task(feed())
+        tasks.append(feeder)
+        try:
+            while True:
+                output = await queues[-1].get()
+                if output is self._DONE:
+                    break
+                yield output
+            await feeder
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
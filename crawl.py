@@ -0,0 +1,286 @@
+import os
+import time
+import logging
+from contextlib import aclosing
+from functools import partial
+from urllib.parse import urlparse
+from pool import CrawlerPool
+from fastpath import FastPath, FAST_PATH
+from entries import VideoEntry, VideoBatch
+from rules import MISSAV_LISTING, MISSAV_DETAIL, MISSAV_SEARCH, ONEJAV_LISTING, crawl_document, share_title
+from concurrency import HostLimiter, WorkerPool, SingleFlight, Pipeline, gather_ordered
+from metrics import metrics
+from tracing import tracer
+from cache import CrawlCache, StateStore, CACHE_TTL, LISTING_CACHE_TTL, normalize_url
+
+logger = logging.getLogger(__name__)
+
+MISSAV_URL = os.getenv('MISSAV_URL', 'https://missav.com/')
+ONEJAV_URL = os.getenv('ONEJAV_URL', 'https://onejav.com/')
+MOJ_LISTING_LIMIT = 30  # Images used per onejav listing page
+MOJ_LISTING_WORKERS = int(os.getenv('MOJ_LISTING_WORKERS', 3))
+MOJ_HIGH_WATER_KEY = "moj_high_water"
+MOJ_SEARCH_WORKERS = int(os.getenv('MOJ_SEARCH_WORKERS', 3))
+MOJ_DETAIL_WORKERS = int(os.getenv('MOJ_DETAIL_WORKERS', 4))
+
+crawler_pool = CrawlerPool()
+fast_path = FastPath()
+host_limiter = HostLimiter()
+detail_pool = WorkerPool()
+crawl_cache = CrawlCache()
+state_store = StateStore()
+listing_pool = WorkerPool(workers=MOJ_LISTING_WORKERS)
+# Identical crawls running at the same time share one browser run
+crawl_flights = SingleFlight()
+
+crawl_seconds = metrics.histogram("crawl_seconds", "Browser crawl (arun) latency per host")
+crawl_wait_seconds = metrics.histogram("crawl_wait_seconds", "Time spent waiting for the host limiter and a browser")
+fast_path_total = metrics.counter("fast_path_total", "Plain HTTP fast-path attempts by outcome")
+metrics.gauge("crawler_pool_idle", "Idle browsers in the crawler pool", lambda: crawler_pool.idle)
+metrics.gauge("host_concurrency_limit", "Adaptive concurrency limit per host",
+              lambda: {(("host", host),): limit for host, (limit, _) in host_limiter.limits().items()})
+metrics.gauge("host_in_flight", "Crawls in flight per host",
+              lambda: {(("host", host),): in_flight for host, (_, in_flight) in host_limiter.limits().items()})
+
+
+# Async function to fetch pages
+async def fetch_pages(base_url, end_page, refresh=False, use_cache=True, progress=None):
+    """
+    Fetches listing pages 1..end_page concurrently, within each host's rate and concurrency limits.
+    Returns a `VideoBatch` of the entries in page order and a {page_num: error} dict for failed pages.
+    `progress(done, total)` is called as pages finish.
+    """
+    done = 0
+
+    async def fetch_page(page_num):
+        nonlocal done
+        try:
+            return await load_page(page_num)
+        finally:
+            done += 1
+            if progress:
+                progress(done, end_page)
+
+    async def load_page(page_num):
+        url = f"{base_url}?page={page_num}"
+        if use_cache and not refresh:
+            cached = crawl_cache.get("listing", url, ttl=LISTING_CACHE_TTL)
+            if cached is not CrawlCache.MISS:
+                return VideoBatch.load(cached)
+        extraction = await crawl_records(url, MISSAV_LISTING, use_cache=False)
+        batch = VideoBatch(
+            VideoEntry(video.alt, video.src, f"{MISSAV_URL}en/{video.code}") for video in extraction["videos"]
+        )
+        if use_cache:
+            crawl_cache.set("listing", url, batch.dump())
+        return batch
+
+    results, errors = VideoBatch(), {}
+    for page_num, batch, error in await gather_ordered(fetch_page, range(1, end_page + 1)):
+        if error:
+            logger.error(f"Error analyzing {base_url}?page={page_num}: {error}")
+            errors[page_num] = str(error) or type(error).__name__
+        else:
+            results.extend(batch)
+    return results, errors
+
+
+# Crawl individual MissAV links
+async def crawl_missav(link, refresh=False, use_cache=True):
+    """
+    Extracts the title and video source of a missav link.
+    Returns `(title, video_src)`, or None when the page has no video.
+    """
+    try:
+        extraction = await crawl_records(link, MISSAV_DETAIL, refresh, use_cache)
+    except Exception as e:
+        logger.error(f"Error crawling {link}: {e}")
+        return None
+    return missav_data(extraction)
+
+
+def missav_data(extraction):
+    if not extraction:
+        return None
+    return share_title(extraction["title"][0].href), extraction["video"][0].src
+
+
+async def crawl_records(url, ruleset, refresh=False, use_cache=True, ttl=CACHE_TTL):
+    """
+    Runs `ruleset` over `url`, shared by coalesced callers and cached per rule set.
+    Returns the `Extraction`, or None when a required rule found nothing.
+    """
+    with tracer.span(f"crawl.{ruleset.name}", url=url) as span:
+        if use_cache and not refresh:
+            cached = crawl_cache.get(ruleset.name, url, ttl=ttl)
+            if cached is not CrawlCache.MISS:
+                span.set(cached=True)
+                return ruleset.load(cached) if cached is not None else None
+        extraction = await crawl_flights.do((ruleset.name, normalize_url(url)), _crawl_records, url, ruleset)
+        if use_cache:
+            crawl_cache.set(ruleset.name, url, extraction.dump() if extraction else None)
+        span.set(found=bool(extraction))
+        return extraction
+
+
+async def _crawl_records(url, ruleset):
+    if FAST_PATH and ruleset.fast:
+        with tracer.span("crawl.fast_path") as span:
+            async with host_limiter.slot(url) as slot:
+                extraction = await fast_path.extract(url, ruleset, slot)
+            # Pages that build their content with JavaScript come back empty and go to the browser
+            outcome = "hit" if extraction and extraction.found and extraction.complete else "fallback"
+            span.set(outcome=outcome)
+        fast_path_total.inc(outcome=outcome)
+        if outcome == "hit":
+            return extraction
+    result = await _arun(url, **ruleset.crawl_options)
+    extraction = ruleset.extract(crawl_document(result))
+    return extraction if extraction.complete else None
+
+
+async def _arun(url, **options):
+    """Crawl `url` with a pooled browser, within the host's rate and concurrency limits."""
+    host = urlparse(url).netloc.lower()
+    waiting = time.monotonic()
+    with tracer.span("crawl.browser", host=host) as span:
+        async with host_limiter.slot(url) as slot:
+            async with crawler_pool.acquire() as crawler:
+                waited = time.monotonic() - waiting
+                crawl_wait_seconds.observe(waited, host=host)
+                span.set(wait=round(waited, 3))
+                with crawl_seconds.time(host=host):
+                    result = await crawler.arun(url=url, **options)
+            slot.record(result)
+        span.set(status=getattr(result, "status_code", None) or 0)
+    if not result.success:
+        raise RuntimeError(result.error_message)
+    return result
+
+
+# General crawl function for any link
+async def simple_crawl(link, refresh=False, use_cache=True):
+    if use_cache and not refresh:
+        cached = crawl_cache.get("markdown", link)
+        if cached is not CrawlCache.MISS:
+            return cached
+    try:
+        markdown = await crawl_flights.do(("markdown", normalize_url(link)), _crawl_markdown, link)
+    except Exception as e:
+        logger.error(f"Error crawling {link}: {e}")
+        return None
+    if use_cache:
+        crawl_cache.set("markdown", link, markdown)
+    return markdown
+
+
+async def _crawl_markdown(link):
+    result = await _arun(link)
+    markdown = result.markdown_v2.raw_markdown if result.markdown_v2 else result.markdown
+    return (markdown or "")[:4000]
+
+
+# Resolve one listing entry to its detail data, or None when the page has no video.
+# Crawl errors raise so the worker pool retries them; a page without a video is not retried
+async def resolve_detail(entry, refresh=False, use_cache=True):
+    return missav_data(await crawl_records(entry.url, MISSAV_DETAIL, refresh, use_cache))
+
+
+async def shutdown():
+    """Close the browsers and the fast-path HTTP session."""
+    await crawler_pool.close()
+    await fast_path.close()
+
+
+def onejav_page_url(page):
+    return ONEJAV_URL if page == 1 else f"{ONEJAV_URL}new?page={page}"
+
+
+async def moj_stream(pages=1, refresh=False, use_cache=True):
+    """
+    Crawls `pages` onejav.com listing pages and finds each release on missav.com.
+    Runs as a pipeline (onejav listing -> missav search -> detail crawl -> match filter)
+    and yields a `VideoEntry` (with code and video set) as soon as each one matches.
+
+    Listing pages are crawled concurrently but read in page order, and the crawl stops at the
+    newest code of the previous run (the high-water mark) unless `refresh` is set. The mark
+    only moves when every release went through every stage, so a failed one is retried next run.
+    """
+    seen = set()
+    high_water = None if refresh else state_store.get(MOJ_HIGH_WATER_KEY)
+    newest = None
+    failed = 0
+
+    async def listing():
+        nonlocal newest, failed
+        urls = [onejav_page_url(page) for page in range(1, pages + 1)]
+        crawl = partial(crawl_records, ruleset=ONEJAV_LISTING, refresh=refresh, use_cache=use_cache,
+                        ttl=LISTING_CACHE_TTL)
+        async with aclosing(listing_pool.run(crawl, urls)) as results:
+            async for url, extraction, error in results:
+                if error:
+                    logger.error(f"Error crawling {url}: {error}")
+                    failed += 1
+                    continue
+                releases = extraction["releases"]
+                if not releases:
+                    logger.warning(f"No releases found on {url}")
+                for release in releases[:MOJ_LISTING_LIMIT]:
+                    newest = newest or release.code
+                    if high_water and release.code == high_water:
+                        logger.info(f"Reached {release.code} from the previous run, stopping at {url}")
+                        return
+                    yield release
+
+    async def search(release):
+        name = release.code
+        extraction = await crawl_records(
+            f"{MISSAV_URL}en/search/{name}", MISSAV_SEARCH, refresh, use_cache, ttl=LISTING_CACHE_TTL
+        )
+        if not extraction["videos"]:
+            logger.info(f"No videos found for search term {name}")
+        hits = []
+        for video in extraction["videos"]:
+            link = f"{MISSAV_URL}en/{video.code}"
+            if link in seen:
+                continue
+            seen.add(link)
+            hits.append((release, name, link))
+        return hits
+
+    async def detail(hit):
+        nonlocal failed
+        release, name, link = hit
+        details = await crawl_missav(link, refresh=refresh, use_cache=use_cache)
+        if not details:
+            logger.info(f"Failed to extract details for link: {link}")
+            failed += 1
+            return []
+        title, video = details
+        return [VideoEntry(title, release.src, link, code=name, video=video)]
+
+    async def match(entry):
+        return [entry] if entry.title.split()[0].replace("-", "") == entry.code else []
+
+    pipeline = Pipeline(
+        ("search", search, MOJ_SEARCH_WORKERS),
+        ("detail", detail, MOJ_DETAIL_WORKERS),
+        ("match", match, 1),
+    )
+    async for entry in pipeline.run(listing()):
+        yield entry
+    # Only a run that got to the end without dropping anything moves the high-water mark
+    failed += pipeline.failed
+    if failed:
+        logger.warning(f"Keeping the high-water mark at {high_water}: {failed} pages or releases failed")
+    elif newest:
+        state_store.set(MOJ_HIGH_WATER_KEY, newest)
+
+
+async def moj(pages=1, refresh=False, use_cache=True):
+    """
+    function to crawl data from onejav.com and missav.com.
+    """
+    data = VideoBatch([entry async for entry in moj_stream(pages, refresh, use_cache)])
+    logger.info(f"Collected data: {len(data)} entries")
+    return data
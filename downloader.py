@@ -0,0 +1,647 @@
+import os
+import re
+import json
+import uuid
+import time
+import socket
+import asyncio
+import logging
+import subprocess
+from pyrogram.errors import FloodWait
+from crawl import crawl_missav
+from jobs import JobStore, FINAL_STATES
+from streaming import stream_upload
+from uploads import UploadIndex, file_hash, video_code
+from cache import normalize_url
+from concurrency import SingleFlight
+from resources import ensure_ffmpeg
+from status_progress import ProgressReporter
+from throughput import transfers, parse_progress
+from metrics import metrics
+from tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+job_seconds = metrics.histogram("job_seconds", "Queued job run time by kind and final state")
+job_queue_seconds = metrics.histogram("job_queue_seconds", "Time jobs waited in the queue for a worker, by kind")
+# The command handlers only queue jobs, so this is the latency users see from command to result
+job_end_to_end_seconds = metrics.histogram(
+    "job_end_to_end_seconds", "Time from a command to its job's final state, queue wait included, by kind and state"
+)
+jobs_rejected = metrics.counter("jobs_rejected_total", "Jobs turned away by kind and full queue (all or the user's)")
+
+
+def parse_kind_map(value, type=float):
+    """Parse `kind=number,...` settings such as JOB_COSTS."""
+    return {kind.strip(): type(number) for kind, number in (item.split("=") for item in value.split(",") if item.strip())}
+
+
+DOWNLOAD_DIR = os.path.join(os.getcwd(), "downloads")
+MAX_DOWNLOADS = int(os.getenv('MAX_DOWNLOADS', 2))
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 4))
+MAX_ATTEMPTS = int(os.getenv('MAX_ATTEMPTS', 3))
+WORKER_NAME = os.getenv('WORKER_NAME', 'bot')
+JOB_LEASE = int(os.getenv('JOB_LEASE', 60))  # Seconds a claimed job stays with a worker that stops renewing it
+JOB_HEARTBEAT = int(os.getenv('JOB_HEARTBEAT', 5))  # Lease renewal and cross-process /cancel interval
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', 1))  # Queue polling for jobs submitted by other processes
+JOB_RETENTION = int(os.getenv('JOB_RETENTION', 7 * 24 * 60 * 60))  # Seconds finished jobs are kept in the store
+# Admission control over the shared queue, counted across all processes; 0 is unlimited
+MAX_QUEUED = int(os.getenv('MAX_QUEUED', 50))  # Queued jobs before new ones are turned away
+USER_MAX_QUEUED = int(os.getenv('USER_MAX_QUEUED', 10))
+USER_MAX_RUNNING = int(os.getenv('USER_MAX_RUNNING', 2))
+# Relative cost of a job by kind (times its pages, for listing crawls); cheaper jobs get served sooner
+JOB_COSTS = parse_kind_map(os.getenv('JOB_COSTS', 'linkfetch=1,rawfetch=1,crawl=1,miss=1,misstg=2,mojtg=3,fetch=5'))
+# Jobs of a kind running at once, leaving workers free for the others
+KIND_MAX_RUNNING = parse_kind_map(os.getenv('KIND_MAX_RUNNING', 'miss=2,misstg=2,mojtg=1'), int)
+
+# Caps concurrent yt-dlp processes across all jobs
+download_slots = asyncio.Semaphore(MAX_DOWNLOADS)
+
+
+async def run_command(command, job=None, on_output=None):
+    """Run a subprocess without blocking the event loop.
+
+    With `on_output`, stdout is read as it is written and each line (split
+    on newlines and carriage returns, as progress bars use) is passed to it.
+    The process is killed if the awaiting task is cancelled. Raises
+    `subprocess.CalledProcessError` on a non-zero exit code.
+    """
+    process = await asyncio.create_subprocess_exec(
+        *command,
+        stdout=asyncio.subprocess.PIPE if on_output else asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    if job:
+        job.process = process
+
+    async def read_output():
+        buffer = b""
+        while chunk := await process.stdout.read(4096):
+            *lines, buffer = re.split(rb"[\r\n]", buffer + chunk)
+            for line in lines:
+                if line.strip():
+                    on_output(line.decode(errors="replace"))
+
+    try:
+        with tracer.span(f"subprocess.{os.path.basename(command[0])}") as span:
+            if on_output:
+                _, stderr, _ = await asyncio.gather(read_output(), process.stderr.read(), process.wait())
+            else:
+                _, stderr = await process.communicate()
+            span.set(returncode=process.returncode)
+    except asyncio.CancelledError:
+        process.kill()
+        await process.wait()
+        raise
+    finally:
+        if job:
+            job.process = None
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command, stderr=stderr)
+
+
+# Utility: Generate thumbnail
+async def generate_thumbnail(video_path, output_path, timestamp="00:00:4", job=None):
+    command = [
+        'ffmpeg',
+        '-ss', str(timestamp),
+        '-i', video_path,
+        '-vframes', '1',
+        '-q:v', '2',
+        '-y',
+        output_path
+    ]
+    try:
+        await ensure_ffmpeg()
+        await run_command(command, job)
+        logger.info(f"Thumbnail saved as {output_path}")
+    except subprocess.CalledProcessError as e:
+        logger.error(f"Error generating thumbnail: {e}")
+
+
+# Download a video with yt-dlp and aria2c, returns the downloaded file path or None.
+# `progress(done_bytes, total_bytes)` gets the progress parsed from their output.
+async def download_video(video_url, title, job=None, progress=None):
+    output_template = os.path.join(DOWNLOAD_DIR, f"{title}.%(ext)s")
+    os.makedirs(DOWNLOAD_DIR, exist_ok=True)
+    command = [
+        "yt-dlp",
+        "--newline",
+        "--external-downloader", "aria2c",
+        # Continue partial aria2c downloads left behind by a restart, print progress every second
+        "--external-downloader-args", "aria2c:--continue=true --summary-interval=1",
+        "--output", output_template,
+        video_url
+    ]
+
+    def on_output(line):
+        parsed = parse_progress(line)
+        if parsed and progress:
+            progress(*parsed)
+
+    async with download_slots:
+        await run_command(command, job, on_output)
+    return next(
+        (
+            os.path.join(DOWNLOAD_DIR, f) for f in os.listdir(DOWNLOAD_DIR)
+            if f.startswith(title) and not f.endswith((".part", ".aria2", ".png"))
+        ),
+        None
+    )
+
+
+class StatusMessage:
+    """Edits a status message by id, so jobs can keep reporting after a restart."""
+
+    def __init__(self, client, chat_id, message_id):
+        self.client = client
+        self.chat_id = chat_id
+        self.message_id = message_id
+
+    async def edit_text(self, text, **kwargs):
+        try:
+            await self.client.edit_message_text(self.chat_id, self.message_id, text, **kwargs)
+        except FloodWait:
+            # Left to the caller, which knows whether to wait or drop the update
+            raise
+        except Exception as e:
+            logger.warning(f"Could not edit status message {self.message_id}: {e}")
+
+    async def delete(self):
+        try:
+            await self.client.delete_messages(self.chat_id, self.message_id)
+        except Exception as e:
+            logger.warning(f"Could not delete status message {self.message_id}: {e}")
+
+
+def new_job_id():
+    return uuid.uuid4().hex[:8]
+
+
+def job_cost(kind, payload):
+    return JOB_COSTS.get(kind, 1) * max(1, payload.get("pages", 1))
+
+
+class QueueFull(Exception):
+    """Raised by `JobRunner.admit` when a job is turned away, with the message shown to the user."""
+
+
+class Job:
+    def __init__(self, link, chat_id, status_message_id, priority=0, refresh=False, use_cache=True,
+                 stream=False, id=None, state="queued", attempts=0, kind="fetch", payload=None, created_at=None, **_):
+        self.id = id or new_job_id()
+        self.kind = kind
+        self.link = link
+        self.chat_id = chat_id
+        self.status_message_id = status_message_id
+        self.priority = priority
+        self.refresh = bool(refresh)
+        self.use_cache = bool(use_cache)
+        self.stream = bool(stream)
+        self.payload = json.loads(payload) if isinstance(payload, str) else (payload or {})
+        self.state = state
+        self.attempts = attempts
+        self.created_at = created_at or time.time()
+        self.process = None
+        self.task = None
+
+    async def set_state(self, state, **fields):
+        self.state = state
+        await asyncio.to_thread(job_store.update, self.id, state=state, **fields)
+
+
+class JobRunner:
+    """Runs jobs from the shared JobStore queue.
+
+    Jobs are handled by kind: /fetch downloads here and the crawl commands
+    in commands.py. The bot process and any number of worker processes
+    (worker.py) each run a JobRunner with JOB_WORKERS workers claiming
+    jobs from the same SQLite queue, highest priority first, so throughput
+    grows with the number of workers. A claimed job is leased to its
+    runner, which renews the lease while the job runs; the jobs of a runner
+    that died go back to the queue when the lease runs out, and yt-dlp and
+    aria2c pick up the partial download left in DOWNLOAD_DIR. Every job has
+    a short id that `/cancel <id>` can use from any process; the runner
+    holding the job cancels it, killing its subprocess, on its next
+    heartbeat.
+
+    Scheduling is fair between users: a user gets at most USER_MAX_RUNNING
+    jobs running and USER_MAX_QUEUED waiting, the queue is served in
+    weighted fair order by JOB_COSTS, heavy kinds are capped by
+    KIND_MAX_RUNNING, and `admit()` sheds new jobs once MAX_QUEUED wait.
+
+    The store's SQLite calls wait on locks held by other processes, so the
+    runner makes them in a thread to keep the event loop free for
+    Telegram updates. Finished jobs are pruned after JOB_RETENTION.
+    """
+
+    def __init__(self, store, workers=JOB_WORKERS, name=WORKER_NAME):
+        self.store = store
+        self.workers = workers
+        self.worker_id = f"{socket.gethostname()}:{name}"
+        self.client = None
+        self.handlers = {}
+        self.kinds = ()
+        self.jobs = {}
+        self._wake = asyncio.Event()
+        self._tasks = []
+        self._pruned = 0
+        # Refreshed by admit() and the heartbeat, so the metrics gauge doesn't query the store on the loop
+        self.queued = 0
+
+    def _queue_state(self, user_id, kind, priority, payload):
+        position = self.store.position(priority, self.store.finish_tag(user_id, job_cost(kind, payload)))
+        user_queued = self.store.count("queued", user_id) if user_id is not None else 0
+        return self.store.count("queued"), user_queued, position
+
+    async def admit(self, user_id, kind, priority=0, payload=None):
+        """Return the queue position a new job would get, or raise QueueFull if it has to be turned away."""
+        queued, user_queued, position = await asyncio.to_thread(
+            self._queue_state, user_id, kind, priority, payload or {}
+        )
+        self.queued = queued
+        if MAX_QUEUED and queued >= MAX_QUEUED:
+            jobs_rejected.inc(kind=kind, reason="queue")
+            raise QueueFull(f"🚦 Busy, position {position} in the queue. Please try again in a few minutes.")
+        if USER_MAX_QUEUED and user_id is not None and user_queued >= USER_MAX_QUEUED:
+            jobs_rejected.inc(kind=kind, reason="user")
+            raise QueueFull(
+                f"🚦 Busy, position {position} in the queue, and you already have {USER_MAX_QUEUED} jobs waiting. "
+                "Please try again once some of them finish."
+            )
+        return position
+
+    def _add(self, job, user_id):
+        self.store.add(
+            id=job.id, kind=job.kind, link=job.link, chat_id=job.chat_id, status_message_id=job.status_message_id,
+            priority=job.priority, refresh=int(job.refresh), use_cache=int(job.use_cache), stream=int(job.stream),
+            payload=json.dumps(job.payload) if job.payload else None,
+            user_id=user_id, vtime=self.store.finish_tag(user_id, job_cost(job.kind, job.payload)),
+        )
+
+    async def submit(self, link, chat_id, status_message_id, priority=0, refresh=False, use_cache=True,
+                     stream=False, kind="fetch", payload=None, id=None, user_id=None):
+        job = Job(link, chat_id, status_message_id, priority, refresh, use_cache, stream, id=id, kind=kind,
+                  payload=payload)
+        await asyncio.to_thread(self._add, job, user_id)
+        self._wake.set()
+        return job
+
+    async def start(self, client, handlers, kinds=None):
+        """Run the jobs of `kinds` (all of `handlers` by default) with `handlers[kind](client, job)`."""
+        self.client = client
+        self.handlers = handlers
+        self.kinds = tuple(kinds or handlers)
+        # Jobs this runner held when it last stopped or crashed are the first to go back in the queue
+        for job_id in await asyncio.to_thread(self.store.release, self.worker_id, MAX_ATTEMPTS):
+            logger.info(f"Queued job {job_id} again after restart")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._heartbeat()))
+        logger.info(f"Job runner {self.worker_id} started with {self.workers} workers for {', '.join(self.kinds)}")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Running jobs go back to the queue for another worker, or this one after a restart
+        await asyncio.to_thread(self.store.release, self.worker_id, MAX_ATTEMPTS)
+
+    async def _worker(self):
+        while True:
+            self._wake.clear()
+            row = await asyncio.to_thread(
+                self.store.claim, self.worker_id, self.kinds, JOB_LEASE, USER_MAX_RUNNING, KIND_MAX_RUNNING
+            )
+            if row is None:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            job = Job(**row)
+            self.jobs[job.id] = job
+            job.task = asyncio.create_task(self._run(job))
+            try:
+                await job.task
+            except asyncio.CancelledError:
+                if job.state != "cancelled":
+                    raise
+            finally:
+                self.jobs.pop(job.id, None)
+                # The job's user and kind may have a free slot now for a job another worker had to skip
+                self._wake.set()
+
+    async def _run(self, job):
+        if job.attempts > 1:
+            logger.info(f"Resuming job {job.id} ({job.kind}) for {job.link}, attempt {job.attempts}")
+            ProgressReporter(StatusMessage(self.client, job.chat_id, job.status_message_id)).update(
+                f"♻️ Resuming job {job.id} after restart... (/cancel {job.id})"
+            )
+        started = time.monotonic()
+        if job.attempts == 1:
+            job_queue_seconds.observe(time.time() - job.created_at, kind=job.kind)
+        # Jobs run apart from the command that queued them, so each is its own trace, found by job id in /trace
+        with tracer.span(f"job.{job.kind}", root=True, job=job.id, link=job.link or None, worker=self.worker_id,
+                         attempt=job.attempts) as span:
+            try:
+                await self.handlers[job.kind](self.client, job)
+                if job.state not in FINAL_STATES:
+                    await job.set_state("done")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Job {job.id} ({job.kind}) failed: {e}")
+                await job.set_state("failed", error=str(e))
+            finally:
+                span.set(state=job.state)
+                job_seconds.observe(time.monotonic() - started, kind=job.kind, state=job.state)
+                # A job released on stop isn't finished and is measured by the runner that finishes it
+                if job.state in FINAL_STATES:
+                    job_end_to_end_seconds.observe(time.time() - job.created_at, kind=job.kind, state=job.state)
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT)
+            try:
+                states = await asyncio.to_thread(self.store.renew, self.worker_id, list(self.jobs), JOB_LEASE)
+                for job_id, state in states.items():
+                    job = self.jobs.get(job_id)
+                    # Cancelled with /cancel in another process
+                    if job and state == "cancelled" and job.state != "cancelled":
+                        await self._cancel(job)
+                for job_id in await asyncio.to_thread(self.store.requeue_expired, MAX_ATTEMPTS):
+                    logger.warning(f"Job {job_id} lost its worker, queued again")
+                    self._wake.set()
+                self.queued = await asyncio.to_thread(self.store.count, "queued")
+                if time.monotonic() - self._pruned > 60 * 60:
+                    self._pruned = time.monotonic()
+                    pruned = await asyncio.to_thread(self.store.prune, JOB_RETENTION)
+                    if pruned:
+                        logger.info(f"Pruned {pruned} finished jobs")
+            except Exception as e:
+                logger.error(f"Job heartbeat failed: {e}")
+
+    async def _cancel(self, job):
+        if job.task:
+            job.task.cancel()
+        # Marks the job before the task sees the cancellation
+        await job.set_state("cancelled")
+
+    async def cancel(self, job_id):
+        job = self.jobs.get(job_id)
+        if job:
+            await self._cancel(job)
+            return True
+        # Queued, or running in another process whose runner stops it on its next heartbeat
+        return await asyncio.to_thread(self.store.cancel, job_id)
+
+
+job_store = JobStore()
+job_runner = JobRunner(job_store)
+metrics.gauge("jobs_queued", "Jobs waiting for a worker in all processes, as of the last heartbeat",
+              lambda: job_runner.queued)
+metrics.gauge("jobs_active", "Jobs running in this process", lambda: len(job_runner.jobs))
+metrics.gauge("transfers_active", "Transfers in progress", lambda: len(transfers.active))
+upload_index = UploadIndex()
+# Jobs for the same video share one download and upload
+deliveries = SingleFlight()
+# Deliveries in progress by video URL, for jobs to join
+delivering = {}
+
+
+# Send a video that was uploaded before by its file_id, returns False if Telegram rejects it
+async def send_uploaded(client, job, status, uploaded):
+    file_id, caption = uploaded
+    try:
+        with tracer.span("telegram.send_video", reused=True):
+            await client.send_video(chat_id=job.chat_id, video=file_id, caption=caption)
+    except Exception as e:
+        logger.warning(f"Could not re-send uploaded file for {job.link}: {e}")
+        return False
+    await job.set_state("done")
+    await status.delete()
+    return True
+
+
+# Pyrogram upload progress callback; async so it runs on the event loop, not in the executor
+async def upload_progress(current, total, progress):
+    progress(current, total)
+
+
+def sent_file_id(message):
+    media = message and (message.video or message.document)
+    return media.file_id if media else None
+
+
+# /fetch pipeline: resolve the link, then download, thumbnail and upload it (or reuse an upload)
+async def fetch_video(client, job):
+    status = ProgressReporter(StatusMessage(client, job.chat_id, job.status_message_id))
+    tracker = transfers.start(job.id)
+    try:
+        # Already uploaded once: answer with the existing file_id, no crawl or download
+        uploaded = None if job.refresh else await asyncio.to_thread(upload_index.find, source_url=job.link)
+        if uploaded and await send_uploaded(client, job, status, uploaded):
+            return
+
+        await job.set_state("resolving")
+        tracker.phase("resolve")
+        status.update(f"🔎 Resolving the video...\nJob: {job.id} (/cancel {job.id})")
+        data = await crawl_missav(job.link, refresh=job.refresh, use_cache=job.use_cache)
+        if not data:
+            await job.set_state("failed", error="No video found")
+            await status.finish("❌ No video found for the given link.", disable_web_page_preview=True)
+            return
+
+        name, video_url = data
+        title = name.split()[0]
+
+        code = video_code(job.link)
+        uploaded = None if job.refresh else await asyncio.to_thread(upload_index.find, code=code)
+        if uploaded and await send_uploaded(client, job, status, uploaded):
+            await asyncio.to_thread(upload_index.add, uploaded[0], uploaded[1], source_url=job.link, code=code)
+            return
+
+        key = normalize_url(video_url)
+        delivery = delivering.get(key)
+        if delivery is None:
+            delivery = delivering[key] = Delivery(client, key, name, title, video_url, job.stream, job.link, code)
+        await delivery.join(job, status)
+        try:
+            delivered = await deliveries.do(key, delivery.run)
+        finally:
+            delivery.leave(job)
+        if not delivered:
+            await job.set_state("failed", error="File not found")
+            await status.finish("❌ Video download failed. File not found.")
+            return
+
+        # The upload went to another job's chat (or was found by content), send it here by file_id
+        file_id, caption, uploader_id = delivered
+        if uploader_id != job.id and not await send_uploaded(client, job, status, (file_id, caption)):
+            raise RuntimeError("Could not send the shared upload")
+        if job.state != "done":
+            await job.set_state("done")
+            await status.delete()
+    except asyncio.CancelledError:
+        if job.state == "cancelled":
+            await status.finish(f"🛑 Job {job.id} cancelled.")
+        raise
+    except subprocess.CalledProcessError as e:
+        logger.error(f"Error downloading video: {e}")
+        await job.set_state("failed", error=str(e))
+        await status.finish("❌ Failed to download the video. Please check the URL or try again.")
+    except Exception as e:
+        logger.error(f"Error uploading video: {e}")
+        await job.set_state("failed", error=str(e))
+        await status.finish("❌ An error occurred while uploading the video.")
+    finally:
+        transfers.finish(job.id)
+
+
+class Delivery:
+    """One download and upload of a video, shared by every job asking for the same video URL.
+
+    Progress and state go to every job still waiting on it. The upload
+    goes to the chat of a job that is still waiting when it starts, and the
+    others get the video by file_id, so a cancelled job neither receives
+    the video nor has its "cancelled" status overwritten. The work stops
+    once every job waiting on it has been cancelled.
+    """
+
+    def __init__(self, client, key, name, title, video_url, stream=False, source_url=None, code=None):
+        self.client = client
+        self.key = key
+        self.name = name
+        self.title = title
+        self.video_url = video_url
+        self.stream = stream
+        self.source_url = source_url
+        self.code = code
+        self.caption = f"📹 {name}"
+        self.waiting = {}
+        self.stage = "⏳ Starting the download...\nJob: {job} (/cancel {job})"
+        self.state = "downloading"
+        self.fields = {}
+
+    async def join(self, job, status):
+        self.waiting[job.id] = (job, status)
+        await job.set_state(self.state)
+        status.update(self.stage.format(job=job.id), **self.fields)
+
+    def leave(self, job):
+        self.waiting.pop(job.id, None)
+
+    def update(self, stage=None, **fields):
+        """Show a new stage (`{job}` is replaced by each job's id) and/or numbers on every waiting job."""
+        if stage is not None:
+            self.stage, self.fields = stage, {}
+        self.fields.update(fields)
+        for job, status in list(self.waiting.values()):
+            status.update(stage and stage.format(job=job.id), **fields)
+
+    async def set_state(self, state):
+        self.state = state
+        await asyncio.gather(*(job.set_state(state) for job, _ in list(self.waiting.values())))
+
+    def progress(self, tracker, field):
+        """Progress callback feeding `tracker` and showing percentage, speed and ETA on every waiting job."""
+        def progress(done, total=None):
+            tracker.update(done, total)
+            self.update(**{field: tracker.percent if tracker.total else done}, speed=tracker.speed, eta=tracker.eta)
+        return progress
+
+    def uploader(self):
+        job, _ = next(iter(self.waiting.values()))
+        return job
+
+    async def run(self):
+        """Returns `(file_id, caption, uploader_job_id)`, or None if the download produced no file."""
+        tracker = transfers.start(self.key)
+        try:
+            return await self._deliver(tracker)
+        finally:
+            transfers.finish(self.key)
+            delivering.pop(self.key, None)
+
+    async def _deliver(self, tracker):
+        if self.stream:
+            # Upload overlaps the download, nothing is written to DOWNLOAD_DIR
+            async with download_slots:
+                job = self.uploader()
+                self.update("📡 Streaming the video to Telegram...\nJob: {job} (/cancel {job})")
+                tracker.phase("stream")
+                with tracer.span("telegram.stream_upload"):
+                    sent = await stream_upload(
+                        self.client, job.chat_id, self.video_url, f"{self.title}.mp4", self.caption,
+                        progress=self.progress(tracker, "uploaded"),
+                    )
+            file_id = sent_file_id(sent)
+            if file_id:
+                await asyncio.to_thread(
+                    upload_index.add, file_id, self.caption, source_url=self.source_url, code=self.code
+                )
+            # The chat was picked when the stream started; take the video back if that job has been cancelled since
+            if job.id not in self.waiting and sent:
+                await self._unsend(job, sent)
+                return file_id, self.caption, None
+            return file_id, self.caption, job.id
+
+        self.update("🔄 Downloading the video...\nJob: {job} (/cancel {job})")
+        tracker.phase("download")
+        downloaded_video = await download_video(
+            self.video_url, self.title, progress=self.progress(tracker, "download")
+        )
+        if not downloaded_video or not os.path.exists(downloaded_video):
+            return None
+
+        content_hash = await asyncio.to_thread(file_hash, downloaded_video)
+        uploaded = await asyncio.to_thread(upload_index.find, content_hash=content_hash)
+        if uploaded:
+            # Every job sends the earlier upload by file_id
+            await asyncio.to_thread(
+                upload_index.add, uploaded[0], uploaded[1], source_url=self.source_url, code=self.code
+            )
+            os.remove(downloaded_video)
+            return uploaded[0], uploaded[1], None
+
+        thumb_path = os.path.join(DOWNLOAD_DIR, f"{self.title}.png")
+        await self.set_state("thumbnailing")
+        self.update("📷 Generating Thumbnail for the video...")
+        tracker.phase("thumbnail")
+        await generate_thumbnail(downloaded_video, thumb_path)
+
+        job = self.uploader()
+        await self.set_state("uploading")
+        self.update("🔼 Uploading the video to Telegram...")
+        tracker.phase("upload")
+        with tracer.span("telegram.send_video", size=os.path.getsize(downloaded_video)):
+            sent = await self.client.send_video(
+                chat_id=job.chat_id,
+                video=downloaded_video,
+                caption=self.caption,
+                thumb=thumb_path if os.path.exists(thumb_path) else None,
+                progress=upload_progress,
+                progress_args=(self.progress(tracker, "upload"),),
+            )
+        file_id = sent_file_id(sent)
+        if file_id:
+            await asyncio.to_thread(
+                upload_index.add, file_id, self.caption, source_url=self.source_url, code=self.code,
+                content_hash=content_hash,
+            )
+
+        # Clean up after upload
+        os.remove(downloaded_video)
+        if os.path.exists(thumb_path):
+            os.remove(thumb_path)
+        if job.id not in self.waiting and sent:
+            await self._unsend(job, sent)
+            return file_id, self.caption, None
+        return file_id, self.caption, job.id
+
+    async def _unsend(self, job, sent):
+        try:
+            await self.client.delete_messages(job.chat_id, sent.id)
+        except Exception as e:
+            logger.warning(f"Could not take back the video sent for cancelled job {job.id}: {e}")
@@ -0,0 +1,61 @@
+from dataclasses import dataclass, fields, astuple
+
+
+@dataclass(slots=True)
+class VideoEntry:
+    """One crawled video: its listing title and thumbnail, missav page and, once resolved, code and stream."""
+    title: str
+    image: str
+    url: str
+    code: str = ""
+    video: str = ""
+
+
+FIELDS = tuple(f.name for f in fields(VideoEntry))
+
+
+class VideoBatch:
+    """Column-oriented container of `VideoEntry` values for large result sets.
+
+    Each field is stored as one list instead of an object per entry;
+    entries are built on access and slicing gives another batch.
+    `dump()`/`load()` give the JSON form used for caching.
+    """
+
+    __slots__ = ("columns",)
+
+    def __init__(self, entries=()):
+        self.columns = {name: [] for name in FIELDS}
+        self.extend(entries)
+
+    def append(self, entry):
+        for name, value in zip(FIELDS, astuple(entry)):
+            self.columns[name].append(value)
+
+    def extend(self, entries):
+        for entry in entries:
+            self.append(entry)
+
+    def __len__(self):
+        return len(self.columns["url"])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            batch = type(self)()
+            batch.columns = {name: column[index] for name, column in self.columns.items()}
+            return batch
+        return VideoEntry(*(self.columns[name][index] for name in FIELDS))
+
+    def __iter__(self):
+        for values in zip(*(self.columns[name] for name in FIELDS)):
+            yield VideoEntry(*values)
+
+    def dump(self):
+        return {name: list(column) for name, column in self.columns.items()}
+
+    @classmethod
+    def load(cls, data):
+        batch = cls()
+        for name in FIELDS:
+            batch.columns[name] = list(data.get(name) or [""] * len(data["url"]))
+        return batch
@@ -0,0 +1,138 @@
+import os
+import time
+import codecs
+import logging
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlparse
+import aiohttp
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+fast_path_requests = metrics.counter("fast_path_requests_total", "Fast-path HTTP requests by outcome")
+
+FAST_PATH = os.getenv('FAST_PATH', '1') == '1'
+FAST_PATH_TIMEOUT = float(os.getenv('FAST_PATH_TIMEOUT', 15))
+FAST_PATH_CONNECTIONS = int(os.getenv('FAST_PATH_CONNECTIONS', 20))
+# How long a host that answered with a bot check is sent straight to the browser
+FAST_PATH_BACKOFF = int(os.getenv('FAST_PATH_BACKOFF', 10 * 60))
+CHUNK_SIZE = 64 * 1024
+USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+)
+
+
+class DocumentParser(HTMLParser):
+    """Feeds images, videos and external links to an `Extraction` while the page is parsed.
+
+    Items have the same shape as crawl4ai's media and links entries.
+    """
+
+    def __init__(self, base_url, extraction):
+        super().__init__(convert_charrefs=True)
+        self.base_url = base_url
+        self.host = urlparse(base_url).netloc.lower()
+        self.extraction = extraction
+        self._href = None
+        self._text = []
+        self._in_video = False
+
+    @property
+    def done(self):
+        """True once every required rule has matched, so the rest of the page can be skipped."""
+        return bool(self.extraction.ruleset.required) and self.extraction.complete
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "img":
+            src = attrs.get("data-src") or attrs.get("src")
+            if src:
+                self.extraction.add("images", {"src": urljoin(self.base_url, src), "alt": attrs.get("alt") or ""})
+        elif tag == "a":
+            self._href = attrs.get("href")
+            self._text = []
+        elif tag == "video":
+            self._in_video = True
+            if attrs.get("src"):
+                self.extraction.add("videos", {"src": urljoin(self.base_url, attrs["src"])})
+        elif tag == "source" and self._in_video and attrs.get("src"):
+            self.extraction.add("videos", {"src": urljoin(self.base_url, attrs["src"])})
+
+    def handle_endtag(self, tag):
+        if tag == "a" and self._href is not None:
+            href = urljoin(self.base_url, self._href)
+            if urlparse(href).netloc.lower() != self.host:
+                self.extraction.add("links", {"href": href, "text": "".join(self._text).strip()})
+            self._href = None
+        elif tag == "video":
+            self._in_video = False
+
+    def handle_data(self, data):
+        if self._href is not None:
+            self._text.append(data)
+
+
+class FastPath:
+    """Plain HTTP fetches parsed while they stream in, used before launching a browser.
+
+    Keeps one pooled keep-alive session. Hosts that answer with a bot
+    check (403/429/503) are skipped for FAST_PATH_BACKOFF seconds so those
+    crawls go straight to the browser.
+    """
+
+    def __init__(self, connections=FAST_PATH_CONNECTIONS, timeout=FAST_PATH_TIMEOUT):
+        self.connections = connections
+        self.timeout = timeout
+        self._session = None
+        self._blocked_until = {}
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.connections, ttl_dns_cache=300, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={"User-Agent": USER_AGENT},
+            )
+        return self._session
+
+    async def extract(self, url, ruleset, slot=None):
+        """Run `ruleset` over `url` as it streams in. Returns the `Extraction`, or None if the fetch failed.
+
+        The response status and any error are recorded on the host limiter's `slot`, if given.
+        """
+        parser = DocumentParser(url, ruleset.start())
+        host = urlparse(url).netloc.lower()
+        if self._blocked_until.get(host, 0) > time.monotonic():
+            return None
+        try:
+            async with self._get_session().get(url) as response:
+                fast_path_requests.inc(outcome=str(response.status))
+                if slot:
+                    slot.record_status(response.status)
+                if response.status in (403, 429, 503):
+                    logger.info(f"Fast path blocked on {host} ({response.status}), using the browser")
+                    self._blocked_until[host] = time.monotonic() + FAST_PATH_BACKOFF
+                    return None
+                if response.status != 200:
+                    return None
+                decoder = codecs.getincrementaldecoder(response.charset or "utf-8")(errors="replace")
+                async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                    parser.feed(decoder.decode(chunk))
+                    if parser.done:
+                        break
+                else:
+                    parser.feed(decoder.decode(b"", final=True))
+                    parser.close()
+        except Exception as e:
+            if slot:
+                slot.ok = False
+            fast_path_requests.inc(outcome="error")
+            logger.info(f"Fast path failed for {url}: {e!r}")
+            return None
+        return parser.extraction
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
@@ -0,0 +1,280 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from cache import DB_PATH
+
+logger = logging.getLogger(__name__)
+
+STATES = (
+    "queued", "claimed", "running", "resolving", "downloading", "thumbnailing", "uploading",
+    "done", "failed", "cancelled",
+)
+FINAL_STATES = ("done", "failed", "cancelled")
+# Claimed by a worker and not finished yet; spelled out so the state index is used
+ACTIVE_STATES = tuple(state for state in STATES if state not in FINAL_STATES + ("queued",))
+ACTIVE = f"state IN ({', '.join(repr(state) for state in ACTIVE_STATES)})"
+
+FIELDS = (
+    "id", "kind", "link", "chat_id", "status_message_id", "state", "priority",
+    "attempts", "refresh", "use_cache", "stream", "error", "created_at", "updated_at",
+    "payload", "worker", "lease_until", "result", "user_id", "vtime",
+)
+
+# Columns added after the table was first created, applied to existing databases on connect
+MIGRATIONS = {
+    "stream": "INTEGER NOT NULL DEFAULT 0",
+    "payload": "TEXT",
+    "worker": "TEXT",
+    "lease_until": "REAL",
+    "result": "TEXT",
+    "user_id": "INTEGER",
+    "vtime": "REAL",
+}
+
+
+def _in(values):
+    return f"({', '.join('?' * len(values))})"
+
+
+class JobStore:
+    """Durable job queue in the crawler_cache SQLite file, shared by the bot and worker processes.
+
+    `claim()` hands the next queued job to one worker with a lease the
+    worker keeps renewing; jobs whose lease ran out (their worker died)
+    are queued again by `requeue_expired()`. The database runs in WAL mode
+    so several processes on the same host can use it at once.
+
+    Queued jobs are served by weighted fair queuing: each gets a virtual
+    finish time (`vtime`, see `finish_tag()`) and the lowest goes first
+    within a priority, so a user with many expensive jobs queued doesn't
+    hold back the cheap jobs of others.
+    """
+
+    def __init__(self, db_path=DB_PATH):
+        self.db_path = db_path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            self._conn.row_factory = sqlite3.Row
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS download_jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL DEFAULT 'fetch',
+                    link TEXT NOT NULL,
+                    chat_id INTEGER,
+                    status_message_id INTEGER,
+                    state TEXT NOT NULL DEFAULT 'queued',
+                    priority INTEGER NOT NULL DEFAULT 0,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    refresh INTEGER NOT NULL DEFAULT 0,
+                    use_cache INTEGER NOT NULL DEFAULT 1,
+                    stream INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    created_at REAL,
+                    updated_at REAL
+                )
+            ''')
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(download_jobs)")}
+            for column, definition in MIGRATIONS.items():
+                if column not in columns:
+                    self._conn.execute(f"ALTER TABLE download_jobs ADD COLUMN {column} {definition}")
+            # Claim order, per-user quotas, the fair-queuing clock and pruning
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS download_jobs_queue ON download_jobs (state, priority DESC, vtime, created_at)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS download_jobs_user ON download_jobs (user_id, state)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS download_jobs_vtime ON download_jobs (vtime)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS download_jobs_updated ON download_jobs (state, updated_at)")
+            self._conn.commit()
+        return self._conn
+
+    def add(self, **job):
+        now = time.time()
+        job.setdefault("created_at", now)
+        job["updated_at"] = now
+        columns = [field for field in FIELDS if field in job]
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                f"INSERT OR REPLACE INTO download_jobs ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                [job[column] for column in columns]
+            )
+            conn.commit()
+
+    def update(self, job_id, **fields):
+        fields["updated_at"] = time.time()
+        with self._lock:
+            conn = self._connect()
+            # A /cancel from another process wins over the progress of the worker running the job
+            conn.execute(
+                f"UPDATE download_jobs SET {', '.join(f'{field} = ?' for field in fields)} "
+                "WHERE id = ? AND state != 'cancelled'",
+                [*fields.values(), job_id]
+            )
+            conn.commit()
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._connect().execute("SELECT * FROM download_jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def unfinished(self):
+        """Jobs that still have work left, highest priority and oldest first."""
+        with self._lock:
+            rows = self._connect().execute(
+                f"SELECT * FROM download_jobs WHERE state NOT IN {_in(FINAL_STATES)} ORDER BY priority DESC, created_at",
+                FINAL_STATES
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def claim(self, worker, kinds, lease, user_limit=0, kind_limits=None):
+        """Take the next queued job of one of `kinds` for `worker`, or None if there is none.
+
+        Skips the jobs of users with `user_limit` jobs running already, and
+        of kinds that have reached their limit in `kind_limits`; 0 or a
+        missing kind is unlimited.
+        """
+        now = time.time()
+        kind_limits = kind_limits or {}
+        with self._lock:
+            conn = self._connect()
+            # Counting and claiming in one write transaction, so two workers can never claim the same job
+            # or both take the last slot of a limit
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                running = conn.execute(f"SELECT kind, COUNT(*) FROM download_jobs WHERE {ACTIVE} GROUP BY kind")
+                full = {kind for kind, count in running if kind_limits.get(kind) and count >= kind_limits[kind]}
+                kinds = [kind for kind in kinds if kind not in full]
+                busy_users = [
+                    user_id for user_id, count in conn.execute(
+                        f"SELECT user_id, COUNT(*) FROM download_jobs WHERE {ACTIVE} AND user_id IS NOT NULL "
+                        "GROUP BY user_id"
+                    ) if user_limit and count >= user_limit
+                ]
+                row = conn.execute(
+                    "UPDATE download_jobs SET state = 'claimed', worker = ?, lease_until = ?, "
+                    "attempts = attempts + 1, updated_at = ? "
+                    "WHERE id = (SELECT id FROM download_jobs WHERE state = 'queued' "
+                    f"AND kind IN {_in(kinds)} AND (user_id IS NULL OR user_id NOT IN {_in(busy_users)}) "
+                    "ORDER BY priority DESC, vtime, created_at LIMIT 1) RETURNING *",
+                    [worker, now + lease, now, *kinds, *busy_users]
+                ).fetchone() if kinds else None
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+        return dict(row) if row else None
+
+    def finish_tag(self, user_id, cost):
+        """Virtual finish time for a new job of `user_id` that costs `cost`.
+
+        A job starts at the later of the queue's virtual clock (the latest
+        tag handed to a worker) and the finish of the user's previous
+        unfinished job, so each user's jobs queue behind their own and
+        interleave with everyone else's in proportion to their cost.
+        """
+        with self._lock:
+            conn = self._connect()
+            clock = conn.execute(
+                "SELECT MAX(vtime) FROM (SELECT vtime FROM download_jobs WHERE vtime IS NOT NULL AND state != 'queued' "
+                "ORDER BY vtime DESC LIMIT 1)"
+            ).fetchone()[0]
+            last = conn.execute(
+                f"SELECT MAX(vtime) FROM download_jobs WHERE user_id = ? AND state NOT IN {_in(FINAL_STATES)}",
+                [user_id, *FINAL_STATES]
+            ).fetchone()[0]
+        return max(clock or 0, last or 0) + cost
+
+    def position(self, priority, vtime):
+        """Place in the queue of a job with `priority` and `vtime`, 1 being next."""
+        with self._lock:
+            return self._connect().execute(
+                "SELECT COUNT(*) FROM download_jobs WHERE state = 'queued' "
+                "AND (priority > ? OR (priority = ? AND COALESCE(vtime, 0) <= ?))",
+                (priority, priority, vtime)
+            ).fetchone()[0] + 1
+
+    def renew(self, worker, job_ids, lease):
+        """Extend the lease of `worker`'s jobs. Returns `{job_id: state}` of those jobs."""
+        if not job_ids:
+            return {}
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                f"UPDATE download_jobs SET lease_until = ? WHERE worker = ? AND id IN {_in(job_ids)} "
+                f"AND state NOT IN {_in(FINAL_STATES)}",
+                [now + lease, worker, *job_ids, *FINAL_STATES]
+            )
+            conn.commit()
+            rows = conn.execute(
+                f"SELECT id, state FROM download_jobs WHERE id IN {_in(job_ids)}", job_ids
+            ).fetchall()
+        return {row["id"]: row["state"] for row in rows}
+
+    def _requeue(self, where, params, max_attempts):
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            rows = conn.execute(
+                f"SELECT id, attempts FROM download_jobs WHERE {ACTIVE} AND {where}", params
+            ).fetchall()
+            for row in rows:
+                if row["attempts"] >= max_attempts:
+                    conn.execute(
+                        "UPDATE download_jobs SET state = 'failed', error = 'Too many attempts', worker = NULL, "
+                        "updated_at = ? WHERE id = ?", (now, row["id"])
+                    )
+                else:
+                    conn.execute(
+                        "UPDATE download_jobs SET state = 'queued', worker = NULL, lease_until = NULL, "
+                        "updated_at = ? WHERE id = ?", (now, row["id"])
+                    )
+            conn.commit()
+        return [row["id"] for row in rows]
+
+    def requeue_expired(self, max_attempts):
+        """Queue again the jobs whose worker stopped renewing their lease. Returns their ids."""
+        # Rows without a lease were left running by a version that had none
+        return self._requeue("(lease_until IS NULL OR lease_until < ?)", [time.time()], max_attempts)
+
+    def release(self, worker, max_attempts):
+        """Queue again every unfinished job held by `worker`, e.g. when it stops or restarts."""
+        return self._requeue("worker = ?", [worker], max_attempts)
+
+    def cancel(self, job_id):
+        """Mark a job cancelled unless it already finished. Returns whether it was."""
+        with self._lock:
+            conn = self._connect()
+            cursor = conn.execute(
+                f"UPDATE download_jobs SET state = 'cancelled', updated_at = ? WHERE id = ? "
+                f"AND state NOT IN {_in(FINAL_STATES)}",
+                [time.time(), job_id, *FINAL_STATES]
+            )
+            conn.commit()
+        return cursor.rowcount > 0
+
+    def prune(self, age):
+        """Delete jobs that reached a final state more than `age` seconds ago. Returns how many."""
+        with self._lock:
+            conn = self._connect()
+            cursor = conn.execute(
+                f"DELETE FROM download_jobs WHERE state IN {_in(FINAL_STATES)} AND updated_at < ?",
+                [*FINAL_STATES, time.time() - age]
+            )
+            conn.commit()
+        return cursor.rowcount
+
+    def count(self, state, user_id=None):
+        where, params = "state = ?", [state]
+        if user_id is not None:
+            where, params = f"{where} AND user_id = ?", params + [user_id]
+        with self._lock:
+            return self._connect().execute(f"SELECT COUNT(*) FROM download_jobs WHERE {where}", params).fetchone()[0]
@@ -0,0 +1,227 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import functools
+from bisect import bisect_left
+from contextlib import contextmanager
+from tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', 9100))  # 0 disables the endpoint
+METRICS_LOG_INTERVAL = int(os.getenv('METRICS_LOG_INTERVAL', 300))  # 0 disables the log dump
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{str(value).replace(chr(34), chr(39))}"' for key, value in pairs) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = _labels(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        for labels, value in self.values.items():
+            yield self.name, labels, value
+
+    def summary(self):
+        for labels, value in self.values.items():
+            yield f"{self.name}{_format_labels(labels)} {value:g}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.values = {}  # labels -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = _labels(labels)
+        data = self.values.get(key)
+        if data is None:
+            data = self.values[key] = [0] * (len(self.buckets) + 2)
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            data[index] += 1
+        data[-2] += value
+        data[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the block, labelled with `outcome` ok/error."""
+        started = time.monotonic()
+        outcome = "error"
+        try:
+            yield
+            outcome = "ok"
+        finally:
+            self.observe(time.monotonic() - started, outcome=outcome, **labels)
+
+    def samples(self):
+        for labels, data in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, data):
+                cumulative += count
+                yield f"{self.name}_bucket", labels + (("le", f"{bound:g}"),), cumulative
+            yield f"{self.name}_bucket", labels + (("le", "+Inf"),), data[-1]
+            yield f"{self.name}_sum", labels, data[-2]
+            yield f"{self.name}_count", labels, data[-1]
+
+    def summary(self):
+        for labels, data in self.values.items():
+            if data[-1]:
+                yield f"{self.name}{_format_labels(labels)} count={data[-1]} avg={data[-2] / data[-1]:.2f}s"
+
+
+class Gauge:
+    """Value read from `func` when metrics are collected; `func` returns a number or {labels dict: number}."""
+    kind = "gauge"
+
+    def __init__(self, name, help, func):
+        self.name = name
+        self.help = help
+        self.func = func
+
+    def samples(self):
+        try:
+            values = self.func()
+        except Exception as e:
+            logger.warning(f"Could not collect {self.name}: {e}")
+            return
+        if not isinstance(values, dict):
+            values = {(): values}
+        for labels, value in values.items():
+            yield self.name, _labels(dict(labels)), value
+
+    def summary(self):
+        for name, labels, value in self.samples():
+            yield f"{name}{_format_labels(labels)} {value:g}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def _register(self, metric):
+        return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help):
+        return self._register(Counter(name, help))
+
+    def histogram(self, name, help, buckets=BUCKETS):
+        return self._register(Histogram(name, help, buckets))
+
+    def gauge(self, name, help, func):
+        return self._register(Gauge(name, help, func))
+
+    def render(self):
+        """Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        return [line for metric in self.metrics.values() for line in metric.summary()]
+
+
+metrics = Registry()
+
+# Commands that run a job only queue it here; job_end_to_end_seconds covers them up to the result
+command_seconds = metrics.histogram("bot_command_seconds", "Bot command handler latency")
+
+
+def timed_command(name):
+    """Decorator recording a command handler's latency and outcome in bot_command_seconds, and tracing it."""
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(*args, **kwargs):
+            message = args[1] if len(args) > 1 else None
+            user = getattr(getattr(message, "from_user", None), "id", None)
+            command = " ".join(getattr(message, "command", None) or [])[:200] or None
+            with command_seconds.time(command=name), tracer.span(f"/{name}", root=True, user=user, command=command):
+                return await handler(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class MetricsServer:
+    """Serves /metrics (Prometheus text) and /transfers (JSON) locally and logs a summary periodically."""
+
+    def __init__(self, registry=metrics, host=METRICS_HOST, port=METRICS_PORT, log_interval=METRICS_LOG_INTERVAL):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.log_interval = log_interval
+        self._runner = None
+        self._log_task = None
+
+    async def start(self):
+        if self.port:
+            try:
+                await self._serve()
+            except Exception as e:
+                logger.error(f"Could not start the metrics endpoint on {self.host}:{self.port}: {e}")
+        if self.log_interval:
+            self._log_task = asyncio.create_task(self._log_periodically())
+
+    async def _serve(self):
+        from aiohttp import web
+        from throughput import transfers
+
+        async def render_metrics(request):
+            return web.Response(text=self.registry.render(), content_type="text/plain", charset="utf-8")
+
+        async def render_transfers(request):
+            return web.Response(text=json.dumps(transfers.snapshot()), content_type="application/json")
+
+        app = web.Application()
+        app.router.add_get("/metrics", render_metrics)
+        app.router.add_get("/transfers", render_transfers)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"Metrics on http://{self.host}:{self.port}/metrics")
+
+    async def _log_periodically(self):
+        while True:
+            await asyncio.sleep(self.log_interval)
+            lines = self.registry.summary()
+            if lines:
+                logger.info("Metrics:\n" + "\n".join(lines))
+
+    async def stop(self):
+        if self._log_task:
+            self._log_task.cancel()
+            self._log_task = None
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+metrics_server = MetricsServer()
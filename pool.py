@@ -0,0 +1,115 @@
+import os
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+logger = logging.getLogger(__name__)
+
+POOL_SIZE = int(os.getenv('CRAWLER_POOL_SIZE', 3))
+MAX_USES = int(os.getenv('CRAWLER_MAX_USES', 50))
+
+
+class CrawlerPool:
+    """Keeps a fixed number of warm AsyncWebCrawler browsers and hands them out.
+
+    A browser is recycled (closed and replaced with a fresh one) after
+    `max_uses` crawls, or immediately when a crawl raises, since a crashed
+    Chromium usually leaves the crawler unusable.
+    """
+
+    def __init__(self, size=POOL_SIZE, max_uses=MAX_USES, **crawler_kwargs):
+        self.size = size
+        self.max_uses = max_uses
+        self.crawler_kwargs = crawler_kwargs
+        self._idle = asyncio.Queue()
+        self._uses = {}
+        self._started = False
+        self._start_lock = asyncio.Lock()
+
+    async def _new_crawler(self):
+        # Imported on first launch, so code that never starts a browser doesn't load crawl4ai
+        from crawl4ai import AsyncWebCrawler
+        crawler = AsyncWebCrawler(**self.crawler_kwargs)
+        await crawler.start()
+        self._uses[crawler] = 0
+        return crawler
+
+    async def _discard(self, crawler):
+        self._uses.pop(crawler, None)
+        try:
+            await crawler.close()
+        except Exception as e:
+            logger.error(f"Error closing crawler: {e}")
+
+    async def start(self):
+        async with self._start_lock:
+            if self._started:
+                return
+            crawlers = await asyncio.gather(*(self._new_crawler() for _ in range(self.size)))
+            for crawler in crawlers:
+                self._idle.put_nowait(crawler)
+            self._started = True
+            logger.info(f"Crawler pool started with {self.size} browsers")
+
+    @property
+    def idle(self):
+        return self._idle.qsize()
+
+    async def warm(self):
+        """Start the browsers in the background without failing the caller."""
+        try:
+            await self.start()
+        except Exception as e:
+            logger.error(f"Error warming up crawler pool: {e}")
+
+    async def close(self):
+        async with self._start_lock:
+            if not self._started:
+                return
+            self._started = False
+            while not self._idle.empty():
+                await self._discard(self._idle.get_nowait())
+            # Crawlers still checked out are closed when they are released
+            logger.info("Crawler pool closed")
+
+    @asynccontextmanager
+    async def acquire(self):
+        if not self._started:
+            await self.start()
+        crawler = await self._idle.get()
+        healthy = True
+        try:
+            yield crawler
+        except Exception:
+            healthy = False
+            raise
+        finally:
+            await self._release(crawler, healthy)
+
+    async def _release(self, crawler, healthy):
+        self._uses[crawler] = self._uses.get(crawler, 0) + 1
+        if self._started and healthy and self._uses[crawler] < self.max_uses:
+            self._idle.put_nowait(crawler)
+            return
+        await self._discard(crawler)
+        if not self._started:
+            return
+        try:
+            crawler = await self._new_crawler()
+        except Exception as e:
+            logger.error(f"Error starting replacement crawler: {e}")
+            # Keep the slot alive; the next acquire retries the launch lazily
+            crawler = None
+        if crawler is None:
+            asyncio.get_running_loop().create_task(self._refill())
+        else:
+            self._idle.put_nowait(crawler)
+
+    async def _refill(self, delay=5):
+        while self._started:
+            await asyncio.sleep(delay)
+            try:
+                self._idle.put_nowait(await self._new_crawler())
+                return
+            except Exception as e:
+                logger.error(f"Error starting replacement crawler: {e}")
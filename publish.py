@@ -0,0 +1,130 @@
+import os
+import json
+import asyncio
+import logging
+from resources import get_telegraph
+from tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+# Telegraph rejects page content over 64 KB of JSON
+TELEGRAPH_PAGE_LIMIT = int(os.getenv('TELEGRAPH_PAGE_LIMIT', 60000))
+NAV_RESERVE = 512  # Room kept on every page for the link to the next one
+TELEGRAPH_URL = "https://graph.org/"
+
+
+def page_url(path):
+    return f"{TELEGRAPH_URL}{path}"
+
+
+def node_size(node):
+    # Size as TelegraphClient serializes it, plus the separating comma
+    return len(json.dumps(node, ensure_ascii=False, separators=(",", ":")).encode()) + 1
+
+
+def entry_nodes(number, entry, heading="title"):
+    """Telegraph nodes for one `VideoEntry`. With `heading="code"` the title goes below the code."""
+    nodes = [{"tag": "img", "attrs": {"src": entry.image}}, {"tag": "br"}]
+    if heading == "code":
+        nodes.append({"tag": "h4", "children": [f"{number}. {entry.code}"]})
+        nodes.append({"tag": "p", "children": [entry.title]})
+    else:
+        nodes.append({"tag": "h4", "children": [f"{number}. {entry.title}"]})
+    nodes.append({"tag": "a", "attrs": {"href": entry.video or "N/A"}, "children": ["Watch Video"]})
+    nodes.extend([{"tag": "br"}, {"tag": "br"}])
+    return nodes
+
+
+def next_page_nodes(path):
+    return [{"tag": "p", "children": [{"tag": "a", "attrs": {"href": page_url(path)}, "children": ["Next page →"]}]}]
+
+
+class NodeBuilder:
+    """Serializes entries to Telegraph nodes as they arrive.
+
+    Each entry's nodes are sized once when added; `paginate()` splits them
+    into pages that fit TELEGRAPH_PAGE_LIMIT without splitting an entry.
+    """
+
+    def __init__(self, heading="title", limit=TELEGRAPH_PAGE_LIMIT, start=1):
+        self.heading = heading
+        self.limit = limit
+        self.number = start - 1
+        self._groups = []
+
+    def add(self, entry):
+        self.number += 1
+        nodes = entry_nodes(self.number, entry, self.heading)
+        self._groups.append((nodes, sum(node_size(node) for node in nodes)))
+
+    def __len__(self):
+        return len(self._groups)
+
+    def paginate(self, used=2):
+        """Node lists per page; `used` is the size already taken on the first page."""
+        budget = self.limit - NAV_RESERVE
+        pages, size = [[]], used
+        for nodes, group_size in self._groups:
+            if size + group_size > budget and size > 2:
+                pages.append([])
+                size = 2
+            pages[-1].extend(nodes)
+            size += group_size
+        return pages
+
+
+class TelegraphPublisher:
+    """Publishes `NodeBuilder` output as one or more Telegraph pages linked in order."""
+
+    def __init__(self, get_client=get_telegraph):
+        self.get_client = get_client
+        self._client = None
+
+    async def client(self):
+        self._client = await self.get_client()
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+    async def _create_pages(self, title, pages):
+        """Create all pages concurrently, then link each one to the next. Returns the paths."""
+        client = await self.client()
+        titles = [title if len(pages) == 1 else f"{title} ({i}/{len(pages)})" for i in range(1, len(pages) + 1)]
+        responses = await client.create_pages(list(zip(titles, pages)))
+        paths = [response["path"] for response in responses]
+        await asyncio.gather(*(
+            client.edit_page(paths[i], titles[i], pages[i] + next_page_nodes(paths[i + 1]))
+            for i in range(len(pages) - 1)
+        ))
+        return paths
+
+    async def publish(self, title, builder):
+        """Publish the builder's entries. Returns the page URLs, first page first."""
+        with tracer.span("telegraph.publish", entries=len(builder)) as span:
+            pages = builder.paginate()
+            paths = await self._create_pages(title, pages)
+            span.set(pages=len(paths))
+        if len(paths) > 1:
+            logger.info(f"Published {len(builder)} entries on {len(paths)} Telegraph pages")
+        return [page_url(path) for path in paths]
+
+    async def append(self, path, builder):
+        """Append the builder's entries to an existing page, continuing on new linked pages if it fills up.
+
+        Returns the URLs of the page and of any pages added after it.
+        """
+        with tracer.span("telegraph.append", entries=len(builder)):
+            client = await self.client()
+            page = await client.get_page(path, return_content=True)
+            content = page["content"]
+            pages = builder.paginate(used=2 + sum(node_size(node) for node in content))
+            paths = await self._create_pages(page["title"], pages[1:]) if len(pages) > 1 else []
+            content = content + pages[0] + (next_page_nodes(paths[0]) if paths else [])
+            await client.edit_page(path, page["title"], content)
+        return [page_url(path)] + [page_url(p) for p in paths]
+
+
+publisher = TelegraphPublisher()
@@ -0,0 +1,84 @@
+import os
+import time
+import asyncio
+import logging
+import functools
+import static_ffmpeg
+from telegraph_client import AsyncTelegraph
+
+logger = logging.getLogger(__name__)
+
+TELEGRAPH_TOKEN_PATH = os.path.join(os.getcwd(), 'crawler_cache', 'telegraph_token')
+TELEGRAPH_SHORT_NAME = "WebCrawlerBot"
+
+
+class StartupReport:
+    """Records how long each boot phase took, measured from process import."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self._last = self.started
+        self.phases = []
+
+    def mark(self, phase):
+        now = time.monotonic()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    def report(self):
+        total = time.monotonic() - self.started
+        phases = ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in self.phases)
+        logger.info(f"Startup took {total:.2f}s ({phases})")
+        return total
+
+
+startup = StartupReport()
+
+
+def lazy(func):
+    """Memoize an async initializer: runs once on first call, concurrent callers wait for it.
+
+    A failed initialization is not memoized, so the next call retries.
+    """
+    lock = None
+    done = False
+    result = None
+
+    @functools.wraps(func)
+    async def wrapper():
+        nonlocal lock, done, result
+        if done:
+            return result
+        if lock is None:
+            lock = asyncio.Lock()
+        async with lock:
+            if not done:
+                started = time.monotonic()
+                result = await func()
+                done = True
+                logger.info(f"Initialized {func.__name__} in {time.monotonic() - started:.2f}s")
+        return result
+
+    return wrapper
+
+
+@lazy
+async def get_telegraph():
+    """Telegraph client, reusing the access token persisted from an earlier run."""
+    token = os.getenv('TELEGRAPH_ACCESS_TOKEN')
+    if not token and os.path.exists(TELEGRAPH_TOKEN_PATH):
+        with open(TELEGRAPH_TOKEN_PATH) as f:
+            token = f.read().strip()
+    telegraph = AsyncTelegraph(access_token=token or None)
+    if not token:
+        await telegraph.create_account(short_name=TELEGRAPH_SHORT_NAME)
+        os.makedirs(os.path.dirname(TELEGRAPH_TOKEN_PATH), exist_ok=True)
+        with open(TELEGRAPH_TOKEN_PATH, "w") as f:
+            f.write(telegraph.get_access_token())
+    return telegraph
+
+
+@lazy
+async def ensure_ffmpeg():
+    """Put static ffmpeg binaries on PATH, downloading them on first use if needed."""
+    await asyncio.to_thread(static_ffmpeg.add_paths)
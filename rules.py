@@ -0,0 +1,156 @@
+import re
+from collections import namedtuple
+from dataclasses import dataclass
+from urllib.parse import unquote_plus
+
+# Sources a rule can read from a crawled document
+SOURCES = ("images", "videos", "links")
+
+
+@dataclass(frozen=True)
+class Rule:
+    """One declarative extraction rule.
+
+    Items of `source` whose `field` matches `pattern` (and not `exclude`)
+    become records with the `keep` attributes of the item plus the named
+    groups of `pattern`.
+    """
+    name: str
+    source: str
+    pattern: str
+    field: str = "src"
+    exclude: str = None
+    keep: tuple = ("src",)
+
+
+class _CompiledRule:
+    def __init__(self, rule, record_type):
+        self.name = rule.name
+        self.field = rule.field
+        self.keep = rule.keep
+        self.pattern = re.compile(rule.pattern)
+        self.exclude = re.compile(rule.exclude) if rule.exclude else None
+        self.record_type = record_type
+
+    def apply(self, item):
+        value = item.get(self.field) or ""
+        match = self.pattern.search(value)
+        if not match or (self.exclude and self.exclude.search(value)):
+            return None
+        fields = {key: item.get(key) or "" for key in self.keep}
+        fields.update(match.groupdict(default=""))
+        return self.record_type(**fields)
+
+
+class RuleSet:
+    """The rules of one page type, compiled once and applied in a single pass.
+
+    `required` names rules that must match for the page to count as
+    found; once they all have, a streaming fetch may stop reading.
+    `fast` allows the plain HTTP fast path, `crawl_options` are passed to
+    `crawler.arun()` when the browser is used.
+    """
+
+    def __init__(self, name, *rules, required=(), fast=True, crawl_options=None):
+        self.name = name
+        self.required = tuple(required)
+        self.fast = fast
+        self.crawl_options = crawl_options or {}
+        self.record_types = {}
+        self._by_source = {source: [] for source in SOURCES}
+        for rule in rules:
+            if rule.source not in self._by_source:
+                raise ValueError(f"Unknown source {rule.source!r} in rule {rule.name!r}")
+            groups = tuple(re.compile(rule.pattern).groupindex)
+            type_name = "".join(part.title() for part in f"{name}_{rule.name}".split("_"))
+            record_type = namedtuple(type_name, rule.keep + tuple(g for g in groups if g not in rule.keep))
+            self.record_types[rule.name] = record_type
+            self._by_source[rule.source].append(_CompiledRule(rule, record_type))
+
+    def start(self):
+        """An empty `Extraction` to be fed items as they are parsed."""
+        return Extraction(self)
+
+    def extract(self, document):
+        """Run all rules over a `{source: [item, ...]}` document."""
+        extraction = self.start()
+        for source, items in document.items():
+            for item in items:
+                extraction.add(source, item)
+        return extraction
+
+    def load(self, data):
+        """Rebuild an `Extraction` from `Extraction.dump()` output."""
+        extraction = self.start()
+        for name, records in data.items():
+            record_type = self.record_types[name]
+            extraction.records[name] = [record_type(**record) for record in records]
+        return extraction
+
+
+class Extraction:
+    """Records found on one page, keyed by rule name."""
+
+    def __init__(self, ruleset):
+        self.ruleset = ruleset
+        self.records = {name: [] for name in ruleset.record_types}
+
+    def add(self, source, item):
+        for rule in self.ruleset._by_source.get(source, ()):
+            record = rule.apply(item)
+            if record is not None:
+                self.records[rule.name].append(record)
+
+    def __getitem__(self, name):
+        return self.records[name]
+
+    @property
+    def complete(self):
+        return all(self.records[name] for name in self.ruleset.required)
+
+    @property
+    def found(self):
+        return any(self.records.values())
+
+    def dump(self):
+        return {name: [record._asdict() for record in records] for name, records in self.records.items()}
+
+
+def crawl_document(result):
+    """The rule sources of a crawl4ai result."""
+    return {
+        "images": result.media.get("images", []),
+        "videos": result.media.get("videos", []),
+        "links": result.links.get("external", []),
+    }
+
+
+MISSAV_LISTING = RuleSet(
+    "missav_listing",
+    Rule("videos", "images", r"/(?P<code>[^/]+)/[^/]*$", exclude="flag", keep=("alt", "src")),
+    crawl_options={"exclude_external_links": True, "exclude_social_media_links": True},
+)
+
+MISSAV_DETAIL = RuleSet(
+    "missav_detail",
+    Rule("title", "links", r"^Telegram$", field="text", keep=("href",)),
+    Rule("video", "videos", r".", keep=("src",)),
+    required=("title", "video"),
+)
+
+MISSAV_SEARCH = RuleSet(
+    "missav_search",
+    Rule("videos", "images", r"^https://fivetiu\.com/(?:.*/)?(?P<code>[^/]+)/[^/]*$"),
+)
+
+# onejav cards are matched on crawl4ai's image description, which plain HTML parsing does not provide
+ONEJAV_LISTING = RuleSet(
+    "onejav_listing",
+    Rule("releases", "images", r"^\s*(?P<code>\S+)", field="desc", keep=("src", "desc")),
+    fast=False,
+)
+
+
+def share_title(href):
+    """Title carried in the `text` parameter of a Telegram share link."""
+    return unquote_plus(href.split("&text=")[-1])
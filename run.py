@@ -1,15 +1,19 @@
-import asyncio
-from crawl4ai import AsyncWebCrawler
+from resources import startup
+from publish import publisher
+from metrics import metrics_server, timed_command
+from tracing import tracer, summarize, format_recent
+from crawl import crawler_pool, shutdown as crawl_shutdown
+from cache import parse_cache_flags
+from downloader import job_runner
+from commands import JOB_HANDLERS, enqueue
+from streaming import STREAM_UPLOAD
 from urllib.parse import unquote
 import os
 import asyncio
 import logging
-import sqlite3
-from pyrogram import Client, filters
+from pyrogram import Client, filters, idle
 from urllib.parse import urlparse, unquote
 from dotenv import load_dotenv
-from telegraph import Telegraph
-import subprocess
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -25,34 +29,12 @@ load_dotenv()
 API_ID = os.getenv('TELEGRAM_API_ID')
 API_HASH = os.getenv('TELEGRAM_API_HASH')
 BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
+# Telegram user ids allowed to use admin commands like /trace; empty allows everyone
+ADMIN_IDS = {int(user_id) for user_id in os.getenv('ADMIN_IDS', '').split(',') if user_id.strip()}
 
 if not all([API_ID, API_HASH, BOT_TOKEN]):
     raise ValueError("Missing Telegram bot credentials. Please set TELEGRAM_API_ID, TELEGRAM_API_HASH, and BOT_TOKEN in .env file")
 
-DB_PATH = os.path.join(os.getcwd(), 'crawler_cache', 'crawler_cache.db')
-
-# Initialize the database
-def initialize_database(db_path):
-    try:
-        os.makedirs(os.path.dirname(db_path), exist_ok=True)
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS crawled_data (
-                url TEXT PRIMARY KEY,
-                content TEXT,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        conn.commit()
-        conn.close()
-        logger.info(f"Database initialized at {db_path}")
-    except Exception as e:
-        logger.error(f"Database initialization error: {e}")
-        raise
-
-initialize_database(DB_PATH)
-
 # Initialize Telegram client and tools
 app = Client(
     "web_crawler_bot",
@@ -60,366 +42,127 @@ app = Client(
     api_hash=API_HASH,
     bot_token=BOT_TOKEN
 )
-telegraph = Telegraph()
-telegraph.create_account(short_name="WebCrawlerBot")
-crawler = AsyncWebCrawler(database_type="sqlite", database_path=DB_PATH, cache_age=24*60*60)
-
-
-# Utility: Generate thumbnail
-def generate_thumbnail(video_path, output_path, timestamp="00:00:4"):
-    command = [
-        'ffmpeg',
-        '-ss', str(timestamp),
-        '-i', video_path,
-        '-vframes', '1',
-        '-q:v', '2',
-        '-y',
-        output_path
-    ]
-    try:
-        subprocess.run(command, check=True, capture_output=True)
-        print(f"Thumbnail saved as {output_path}")
-    except subprocess.CalledProcessError as e:
-        print(f"Error generating thumbnail: {e}")
-
-# Async function to fetch pages
-async def fetch_pages(base_url, end_page):
-    results = []
-    async with AsyncWebCrawler() as crawler:
-        for page_num in range(1, end_page + 1):
-            url = f"{base_url}?page={page_num}"
-            try:
-                result = await crawler.arun(
-                    url=url,
-                    exclude_external_links=True,
-                    exclude_social_media_links=True,
-                )
-                videos = [
-                    [img["alt"], img["src"], f"https://missav.com/en/{img['src'].split('/')[-2]}"]
-                    for img in result.media.get("images", [])
-                    if img["src"] and "flag" not in img["src"]
-                ]
-                results.extend(videos)
-            except Exception as e:
-                logger.error(f"Error analyzing {url}: {e}")
-    return results
-
-
-
-async def crawl_missav(link):
-    """
-    Crawls a specific missav link to extract the title and video source.
-    """
-    try:
-        async with AsyncWebCrawler() as crawler:
-            result = await crawler.arun(url=link)
-            title = [
-                unquote(i["href"].split("&text=")[-1]).replace("+", " ")
-                for i in result.links.get("external", [])
-                if i["text"] == "Telegram"
-            ]
-            videos = [
-                video["src"]
-                for video in result.media.get("videos", [])
-                if video.get("src")
-            ]
-            return title[0] if title else None, videos[0] if videos else None
-    except Exception as e:
-        print(f"Error while crawling link {link}: {e}", exc_info=True)
-        return None, None
-
-
-# General crawl function for any link
-async def simple_crawl(link):
-    async with AsyncWebCrawler() as crawler:
-        try:
-            result = await crawler.arun(url=link)
-            return result.markdown_v2[:4000] if result and len(result.markdown_v2) > 4000 else result.markdown_v2
-        except Exception as e:
-            logger.error(f"Error crawling {link}: {e}")
-            return None
-    
-async def moj():
-    """
-    function to crawl data from onejav.com and missav.com.
-    """
-    async with AsyncWebCrawler() as crawler:
-        seen = set()
-        data = []
-
-        try:
-            # Crawl onejav.com to get initial data
-            result = await crawler.arun(url="https://onejav.com/")
-            images = result.media.get("images", [])[:30]
-            if not images:
-                print("No images found on onejav.com")
-                return
-            for image in images:
-                try:
-                    name = image.get("desc", "").split()[0]
-                    if not name:
-                        print(f"Skipping image with missing description: {image}")
-                        continue
-                    search_url = f"https://missav.com/en/search/{name}"
-                    search_result = await crawler.arun(url=search_url)
-                    vids = [
-                        img["src"]
-                        for img in search_result.media.get("images", [])
-                        if img["src"].startswith("https://fivetiu.com")
-                    ]
-                    if not vids:
-                        print(f"No videos found for search term {name}")
-                        continue
-                    # Process each video link
-                    for img in vids:
-                        link = f"https://missav.com/en/{img.split('/')[-2]}"
-                        if link in seen:
-                            print(f"Skipping already processed link: {link}")
-                            continue
-                        seen.add(link)
-
-                        # Crawl missav link for detailed information
-                        title, src = await crawl_missav(link)
-                        if not title or not src:
-                            print(f"Failed to extract details for link: {link}")
-                            continue
-
-                        if title.split()[0].replace("-", "") == name:
-                            data.append(
-                                [ title,name,image["src"],src
-                                ]
-                            )
-                except Exception as e:
-                    print(f"Error processing image {image}: {e}", exc_info=True)
-
-        except Exception as e:
-            print(f"Error crawling onejav.com: {e}", exc_info=True)
-
-        # Log final data
-        print(f"Collected data: {len(data)} entries")
-        return data
-
-
 
 
 # Command: Fetch MissAV links from pages
 @app.on_message(filters.command("miss"))
+@timed_command("miss")
 async def miss_command(client, message):
-    if len(message.command) < 3:
-        await message.reply_text("Usage: /miss [base_url] [pages]\nExample: /miss https://missav.com/dm561/en/uncensored-leak 2")
+    args, refresh, use_cache = parse_cache_flags(message.command)
+    if len(args) < 3 or not args[2].isdigit():
+        await message.reply_text(
+            "Usage: /miss [base_url] [pages]\nExample: /miss https://missav.com/dm561/en/uncensored-leak 2"
+        )
         return
-    base_url, pages = message.command[1], int(message.command[2])
-    status_message = await message.reply_text("🔄 Fetching MissAV links...")
-    links = await fetch_pages(base_url, end_page=pages)
-    formatted_links = "\n".join([f"{i + 1}. {link[0]}" for i, link in enumerate(links)])
-    await status_message.edit_text(f"📄 Links fetched:\n\n{formatted_links}", disable_web_page_preview=True)
-
+    await enqueue(message, "miss", args[1], refresh, use_cache, pages=int(args[2]))
 
 
 @app.on_message(filters.command("misstg"))
-async def miss_command(client, message):
-    if len(message.command) < 3:
+@timed_command("misstg")
+async def misstg_command(client, message):
+    args, refresh, use_cache = parse_cache_flags(message.command)
+    if len(args) < 3 or not args[2].isdigit():
         await message.reply_text(
-            "Usage: /miss [base_url] [pages]\nExample: /miss https://missav.com/dm561/en/uncensored-leak 2"
+            "Usage: /misstg [base_url] [pages]\nExample: /misstg https://missav.com/dm561/en/uncensored-leak 2"
         )
         return
-    
-    base_url, pages = message.command[1], int(message.command[2])
-    status_message = await message.reply_text("🔄 Fetching MissAV links...")
-    
-    try:
-        # Fetch the links and process
-        links = await fetch_pages(base_url, end_page=pages)
-        src_links = []
-        for link in links:
-            src_result = await crawl_missav(link[-1])  # Await the coroutine
-            src = src_result[-1]  # Access the last element of the returned result
-            link.append(src)
-            src_links.append(link)
-        # Prepare Telegraph content
-        telegraph_content = ""
-        for i, data in enumerate(src_links):
-            title,img_url, video_url = link[0], link[1], link[2]
-            video_src = link[3] if len(link) > 3 else "N/A"
-            telegraph_content += (
-                f'<img src="{img_url}"/><br>'
-                f"<h4>{i + 1}. {title}</h4>"
-                f'<a href="{video_src}">Watch Video</a><br><br>'
-            )
-
-        # Create and publish Telegraph page
-        response = telegraph.create_page(
-            title="Missav Links",
-            html_content=telegraph_content
-        )
-        
-        telegraph_url = f"https://graph.org/{response['path']}"
-        await status_message.edit_text(
-            f"✅ Links fetched! View them here:\n\n{telegraph_url}"
-        )
-    except Exception as e:
-        logger.error(f"Error fetching links: {e}")
-        await status_message.edit_text("❌ Failed to fetch links. Please try again.")
-
+    await enqueue(message, "misstg", args[1], refresh, use_cache, pages=int(args[2]))
 
 
 @app.on_message(filters.command("mojtg"))
+@timed_command("mojtg")
 async def moj_command(client, message):
-    if len(message.command) < 2:
+    args, refresh, use_cache = parse_cache_flags(message.command)
+    if len(args) < 2 or not args[1].isdigit():
         await message.reply_text("Usage: /mojtg [pages]\nExample: /mojtg 2")
         return
+    await enqueue(message, "mojtg", refresh=refresh, use_cache=use_cache, pages=int(args[1]))
 
-    try:
-        # Parse input
-        pages = int(message.command[1])
-        base_url = "https://onejav.com/"
-        status_message = await message.reply_text("🔄 Fetching OneJav links...")
-
-        # Fetch data using moj function
-        links = await moj()  # Modify `moj` function to accept pages if needed
-
-        # Check if links are found
-        if not links:
-            await status_message.edit_text("❌ No links found. Try again later.")
-            return
-
-        # Process links for Telegraph
-        telegraph_content = ""
-        for i, link in enumerate(links):
-            title, code, img_url, video_url = link[0], link[1], link[2], link[3]
-            telegraph_content += (
-                f'<img src="{img_url}"/><br>'
-                f"<h4>{i + 1}. {code}</h4>"
-                f"<h8>{title}</h8>"
-                f'<a href="{video_url}">Watch Video</a><br><br>'
-            )
-
-        # Create Telegraph page
-        response = telegraph.create_page(
-            title="OneJav Links",
-            html_content=telegraph_content
-        )
-        telegraph_url = f"https://graph.org/{response['path']}"
-
-        # Reply with the Telegraph link
-        await status_message.edit_text(f"✅ Links fetched! View them here:\n\n{telegraph_url}")
-
-    except ValueError:
-        await message.reply_text("❌ Invalid number of pages. Please provide a valid integer.")
-    except Exception as e:
-        logger.error(f"Error in /mojtg command: {e}")
-        await message.reply_text("❌ An error occurred while processing your request.")
 
 # Command: Crawl any specific link
 @app.on_message(filters.command("crawl"))
+@timed_command("crawl")
 async def crawl_command(client, message):
-    if len(message.command) < 2:
+    args, refresh, use_cache = parse_cache_flags(message.command)
+    if len(args) < 2:
         await message.reply_text("Usage: /crawl [link]\nExample: /crawl https://www.google.com")
         return
-    link = message.command[1]
-    status_message = await message.reply_text("🔄 Fetching...")
-    result = await simple_crawl(link)
-    await status_message.edit_text(f"📄 Data Fetched:\n\n{result}", disable_web_page_preview=True)
+    await enqueue(message, "crawl", args[1], refresh, use_cache)
 
 
+@app.on_message(filters.command("linkfetch"))
+@timed_command("linkfetch")
+async def linkfetch_command(client, message):
+    args, refresh, use_cache = parse_cache_flags(message.command)
+    if len(args) < 2:
+        await message.reply_text("Usage: /linkfetch [link]\nExample: /linkfetch https://missav.com/en/...")
+        return
+    await enqueue(message, "linkfetch", args[1], refresh, use_cache)
 
 
-@app.on_message(filters.command("linkfetch"))
+# Command: Fetch video and upload
+@app.on_message(filters.command("fetch"))
+@timed_command("fetch")
 async def fetch_command(client, message):
-    if len(message.command) < 2:
-        await message.reply_text("Usage: /fetch [link]\nExample: /fetch https://missav.com/en/...")
+    args, refresh, use_cache = parse_cache_flags(message.command)
+    if len(args) < 2:
+        await message.reply_text("Usage: /fetch [link] [priority]\nExample: /fetch https://missav.com/en/...")
         return
-    link = message.command[1]
-    status_message = await message.reply_text("🔄 Fetching details for the given link...")
-    
-    data = await crawl_missav(link)
-    if not data:
-        await status_message.edit_text("❌ No video found for the given link.", disable_web_page_preview=True)
+    stream = STREAM_UPLOAD or "--stream" in args
+    args = [arg for arg in args if arg != "--stream"]
+    priority = int(args[2]) if len(args) > 2 and args[2].lstrip("-").isdigit() else 0
+    # Jumping the fair queue is for admins; anyone may lower their own job's priority
+    if priority > 0 and not (message.from_user and message.from_user.id in ADMIN_IDS):
+        priority = 0
+    await enqueue(message, "fetch", args[1], refresh, use_cache, priority=priority, stream=stream)
+
+
+@app.on_message(filters.command("cancel"))
+@timed_command("cancel")
+async def cancel_command(client, message):
+    if len(message.command) < 2:
+        await message.reply_text("Usage: /cancel [job_id]")
         return
+    if await job_runner.cancel(message.command[1]):
+        await message.reply_text(f"🛑 Cancelling job {message.command[1]}...")
     else:
-        await status_message.edit_text(f"Title: {data[0]}\nUrl: {data[-1]}")
-        return 
+        await message.reply_text("❌ No queued or running job with that id.")
 
 
-# Command: Fetch video and upload
-@app.on_message(filters.command("fetch"))
-async def fetch_command(client, message):
+# Not timed or traced itself, so it doesn't crowd the list of recent traces
+@app.on_message(filters.command("trace"))
+async def trace_command(client, message):
+    if ADMIN_IDS and (not message.from_user or message.from_user.id not in ADMIN_IDS):
+        await message.reply_text("❌ /trace is only available to the bot admins.")
+        return
     if len(message.command) < 2:
-        await message.reply_text("Usage: /fetch [link]\nExample: /fetch https://missav.com/en/...")
+        await message.reply_text(format_recent(tracer.recent()))
         return
-    link = message.command[1]
-    status_message = await message.reply_text("🔄 Fetching details for the given link...")
-    
-    data = await crawl_missav(link)
-    if not data:
-        await status_message.edit_text("❌ No video found for the given link.", disable_web_page_preview=True)
+    spans = await tracer.find(message.command[1])
+    if not spans:
+        await message.reply_text("❌ No trace with that id.")
         return
-    
-    name, video_url = data
-    title = name.split()[0]
-    thumb_path = f"{title}.png"
-    
-    try:
-        output_template = os.path.join(os.getcwd(), "downloads", f"{title}.%(ext)s")
-        os.makedirs(os.path.dirname(output_template), exist_ok=True)
-        
-        # Run yt-dlp with aria2c as the external downloader
-        command = [
-            "yt-dlp",
-            "--external-downloader", "aria2c",
-            "--output", output_template,
-            video_url
-        ]
-        
-        await status_message.edit_text("🔄 Downloading the video...")
-        subprocess.run(command, check=True)
-        
-        # Locate the downloaded video file
-        downloaded_video = next(
-            (os.path.join("downloads", f) for f in os.listdir("downloads") if f.startswith(title)),
-            None
-        )
-        
-        if downloaded_video and os.path.exists(downloaded_video):
-            await status_message.edit_text("📷 Generating Thumbnail for the video...")
-            generate_thumbnail(downloaded_video, thumb_path)
-            
-            await status_message.edit_text("🔼 Uploading the video to Telegram...")
-            await app.send_video(
-                chat_id=message.chat.id,
-                video=downloaded_video,
-                caption=f"📹{name}",
-                thumb=thumb_path
-            )
-            await status_message.delete()
-            
-            # Clean up after upload
-            os.remove(downloaded_video)
-        else:
-            await status_message.edit_text("❌ Video download failed. File not found.")
-    except subprocess.CalledProcessError as e:
-        logger.error(f"Error downloading video: {e}")
-        await status_message.edit_text("❌ Failed to download the video. Please check the URL or try again.")
-    except Exception as e:
-        logger.error(f"Error uploading video: {e}")
-        await status_message.edit_text("❌ An error occurred while uploading the video.")
-        
+    await message.reply_text(summarize(spans)[:4000], disable_web_page_preview=True)
 
 
 # Command: Start message
 @app.on_message(filters.command("start"))
+@timed_command("start")
 async def start_command(client, message):
     await message.reply_text(
         "👋 Welcome to the Web Crawler Bot!\n\n"
         "Commands:\n"
         "/miss [base_url] [pages] - Fetch all links from MissAV pages\n"
         "/crawl [link] - Crawls any link\n"
-        "/fetch [link] - Fetch video from link and upload to Telegram\n"
+        "/fetch [link] [priority] - Fetch video from link and upload to Telegram (--stream to upload while downloading; priority above 0 for admins)\n"
+        "/cancel [job_id] - Cancel a queued or running job\n"
+        "/trace [id] - Recent command traces, or the critical path of one (admins)\n"
         "/start - Show this welcome message\n"
     )
 
 
 @app.on_message(filters.command("help"))
+@timed_command("help")
 async def help_command(client, message):
     await message.reply_text(
         "🤖 Web Crawler Bot Help\n\n"
@@ -427,13 +170,37 @@ async def help_command(client, message):
         "/miss [base_url] [pages] - Fetch all links from MissAV pages\n"
         "/fetchm [link] - Fetch details for a specific MissAV link\n"
         "/start - Show welcome message\n\n"
+        "Add --refresh to re-crawl instead of using cached results, or --nocache to skip the cache.\n\n"
         "Examples:\n"
         "/miss https://missav.com/dm561/en/uncensored-leak 2\n"
         "/fetchm https://missav.com/en/..."
     )
 
 # Run the bot
-if __name__ == "__main__":
+async def main():
+    startup.mark("imports")
+    await app.start()
+    startup.mark("telegram")
+    await job_runner.start(app, JOB_HANDLERS)
+    startup.mark("jobs")
+    await metrics_server.start()
+    # Browsers warm up in the background; a crawl arriving first waits for them.
+    # With JOB_WORKERS=0 the jobs run in worker.py processes instead
+    if job_runner.workers:
+        asyncio.create_task(crawler_pool.warm())
+    startup.report()
     print("Bot is running...")
-    app.run()
+    try:
+        await idle()
+    finally:
+        await metrics_server.stop()
+        await job_runner.stop()
+        await app.stop()
+        await crawl_shutdown()
+        await publisher.close()
+        await tracer.close()
+
+
+if __name__ == "__main__":
+    app.run(main())
 
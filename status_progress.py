@@ -0,0 +1,131 @@
+import os
+import time
+import asyncio
+import logging
+from pyrogram.errors import FloodWait
+from tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+STATUS_INTERVAL = float(os.getenv('STATUS_INTERVAL', 3))
+
+
+def format_bytes(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.1f} {unit}" if unit != "B" else f"{int(size)} B"
+        size /= 1024
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds}s"
+
+
+# How live numbers are shown under the stage line, in this order
+FIELDS = {
+    "pages": lambda value: f"Pages: {value[0]}/{value[1]}",
+    "resolved": lambda value: f"Resolved: {value[0]}/{value[1]}",
+    "found": lambda value: f"Found: {value}",
+    "download": lambda value: f"Download: {value:.1f}%",
+    "speed": lambda value: f"Speed: {format_bytes(value)}/s",
+    "eta": lambda value: f"ETA: {format_duration(value)}",
+    "upload": lambda value: f"Upload: {value:.1f}%",
+    "uploaded": lambda value: f"Uploaded: {format_bytes(value)}",
+}
+
+
+class ProgressReporter:
+    """Coalesces progress updates for one status message.
+
+    `update()` only records the latest state; the message is edited at
+    most once per `interval` seconds with whatever is current by then, and
+    not at all if the text did not change. Edits go out one at a time, so
+    `finish()` cancels the pending edit, waits for one already in flight
+    and always writes the final text last. A FloodWait pushes the next
+    edit back by the time Telegram asks for.
+
+    Works with anything that has an async `edit_text` (a pyrogram Message
+    or a `StatusMessage`).
+    """
+
+    def __init__(self, status_message, stage="", interval=STATUS_INTERVAL):
+        self.status_message = status_message
+        self.interval = interval
+        self.stage = stage
+        self.fields = {}
+        self._last_text = None
+        self._next_edit = 0
+        self._pending = None
+        self._lock = asyncio.Lock()
+        self._finished = False
+
+    def render(self):
+        lines = [self.stage] + [render(self.fields[name]) for name, render in FIELDS.items() if name in self.fields]
+        return "\n".join(line for line in lines if line)
+
+    def update(self, stage=None, **fields):
+        """Record a new stage (which clears the live numbers) and/or numbers; `None` removes a number."""
+        if stage is not None and stage != self.stage:
+            self.stage = stage
+            self.fields = {}
+        for name, value in fields.items():
+            if value is None:
+                self.fields.pop(name, None)
+            else:
+                self.fields[name] = value
+        # A late update must not schedule an edit over the final text
+        if self._pending is None and not self._finished:
+            self._pending = asyncio.get_running_loop().create_task(self._flush_later())
+
+    async def _flush_later(self):
+        delay = self._next_edit - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        async with self._lock:
+            # Updates from here on need another edit; finish() waits for this one on the lock
+            self._pending = None
+            await self._edit(self.render())
+
+    async def _edit(self, text, **kwargs):
+        """Edit the message, returns the FloodWait in seconds if Telegram asked to back off."""
+        if text == self._last_text:
+            return 0
+        self._next_edit = time.monotonic() + self.interval
+        try:
+            with tracer.span("telegram.edit_message"):
+                await self.status_message.edit_text(text, **kwargs)
+            self._last_text = text
+        except FloodWait as e:
+            logger.warning(f"FloodWait of {e.value}s on a status message, holding back updates")
+            self._next_edit = time.monotonic() + e.value
+            return e.value
+        except Exception as e:
+            logger.warning(f"Could not update status message: {e}")
+        return 0
+
+    def _cancel_pending(self):
+        if self._pending is not None:
+            self._pending.cancel()
+            self._pending = None
+
+    async def finish(self, text=None, **kwargs):
+        """Write the final state now, replacing it with `text` if given."""
+        self._finished = True
+        self._cancel_pending()
+        if text is not None:
+            self.stage, self.fields = text, {}
+        async with self._lock:
+            wait = await self._edit(self.render(), **kwargs)
+            if wait:
+                await asyncio.sleep(wait)
+                await self._edit(self.render(), **kwargs)
+
+    async def delete(self):
+        self._cancel_pending()
+        async with self._lock:
+            await self.status_message.delete()
@@ -0,0 +1,139 @@
+import os
+import asyncio
+import logging
+from pyrogram import raw, types
+from resources import ensure_ffmpeg
+
+logger = logging.getLogger(__name__)
+
+STREAM_UPLOAD = os.getenv('STREAM_UPLOAD', '0') == '1'
+PART_SIZE = 512 * 1024  # Largest part size Telegram accepts
+SPOOL_PARTS = int(os.getenv('SPOOL_PARTS', 32))
+UPLOAD_WORKERS = int(os.getenv('UPLOAD_WORKERS', 4))
+
+
+async def _read_part(stream):
+    part = b""
+    while len(part) < PART_SIZE:
+        chunk = await stream.read(PART_SIZE - len(part))
+        if not chunk:
+            break
+        part += chunk
+    return part
+
+
+async def _spool(stream, spool):
+    """Cut the stream into parts and put `(index, part, is_last)` on the spool.
+
+    Reads one part ahead so the last part can be flagged, which is when the
+    total number of parts becomes known.
+    """
+    index = 0
+    part = await _read_part(stream)
+    while part:
+        next_part = await _read_part(stream)
+        await spool.put((index, part, not next_part))
+        index += 1
+        part = next_part
+    return index
+
+
+async def _upload_parts(client, file_id, spool, uploaded, progress=None):
+    while True:
+        item = await spool.get()
+        if item is None:
+            return
+        index, part, is_last = item
+        await client.invoke(raw.functions.upload.SaveBigFilePart(
+            file_id=file_id,
+            file_part=index,
+            # -1 while the size is unknown; the last part carries the real total
+            file_total_parts=index + 1 if is_last else -1,
+            bytes=part
+        ))
+        uploaded.append(len(part))
+        if progress:
+            progress(sum(uploaded))
+
+
+async def stream_upload(client, chat_id, video_url, file_name, caption, job=None, progress=None):
+    """Download `video_url` and upload it to Telegram at the same time, returns the sent Message.
+
+    yt-dlp writes the stream to stdout, ffmpeg remuxes it into fragmented
+    MP4 and the output is cut into 512 KiB parts that are uploaded with
+    `upload.saveBigFilePart` as soon as they are read. Parts wait in a
+    spool of at most SPOOL_PARTS parts in memory, so nothing touches the
+    disk and a slow upload throttles the download instead of piling up.
+    """
+    await ensure_ffmpeg()
+    read_fd, write_fd = os.pipe()
+    try:
+        downloader = await asyncio.create_subprocess_exec(
+            "yt-dlp", "--quiet", "--output", "-", video_url,
+            stdout=write_fd, stderr=asyncio.subprocess.PIPE,
+        )
+        remuxer = await asyncio.create_subprocess_exec(
+            "ffmpeg", "-loglevel", "error", "-i", "pipe:0",
+            "-c", "copy", "-f", "mp4", "-movflags", "frag_keyframe+empty_moov", "pipe:1",
+            stdin=read_fd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+        )
+    finally:
+        os.close(read_fd)
+        os.close(write_fd)
+    if job:
+        job.process = downloader
+
+    file_id = client.rnd_id()
+    spool = asyncio.Queue(maxsize=SPOOL_PARTS)
+    uploaded = []
+    uploaders = [
+        asyncio.create_task(_upload_parts(client, file_id, spool, uploaded, progress))
+        for _ in range(UPLOAD_WORKERS)
+    ]
+
+    async def feed():
+        total = await _spool(remuxer.stdout, spool)
+        for _ in uploaders:
+            await spool.put(None)
+        return total
+
+    feeder = asyncio.create_task(feed())
+    try:
+        # Fails fast if an upload fails, instead of leaving the feeder blocked on a full spool
+        total_parts, *_ = await asyncio.gather(feeder, *uploaders)
+        if await downloader.wait() != 0:
+            raise RuntimeError(f"yt-dlp failed: {(await downloader.stderr.read()).decode(errors='ignore')}")
+        if await remuxer.wait() != 0 or not total_parts:
+            raise RuntimeError(f"ffmpeg failed: {(await remuxer.stderr.read()).decode(errors='ignore')}")
+    except BaseException:
+        for task in (feeder, *uploaders):
+            task.cancel()
+        for process in (downloader, remuxer):
+            if process.returncode is None:
+                process.kill()
+        raise
+    finally:
+        if job:
+            job.process = None
+
+    logger.info(f"Streamed {sum(uploaded)} bytes in {total_parts} parts for {file_name}")
+    updates = await client.invoke(raw.functions.messages.SendMedia(
+        peer=await client.resolve_peer(chat_id),
+        media=raw.types.InputMediaUploadedDocument(
+            file=raw.types.InputFileBig(id=file_id, parts=total_parts, name=file_name),
+            mime_type="video/mp4",
+            attributes=[
+                raw.types.DocumentAttributeVideo(duration=0, w=0, h=0, supports_streaming=True),
+                raw.types.DocumentAttributeFilename(file_name=file_name),
+            ],
+        ),
+        message=caption,
+        random_id=client.rnd_id(),
+    ))
+    # Parse the sent message like send_video does, so callers get its file_id
+    users = {user.id: user for user in updates.users}
+    chats = {chat.id: chat for chat in updates.chats}
+    for update in updates.updates:
+        if isinstance(update, (raw.types.UpdateNewMessage, raw.types.UpdateNewChannelMessage)):
+            return await types.Message._parse(client, update.message, users, chats)
+    return None
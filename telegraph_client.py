@@ -0,0 +1,125 @@
+import os
+import json
+import random
+import asyncio
+import logging
+import aiohttp
+from metrics import metrics
+from tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+request_seconds = metrics.histogram("telegraph_request_seconds", "Telegraph API call latency, retries included")
+retries_total = metrics.counter("telegraph_retries_total", "Telegraph API calls retried")
+
+TELEGRAPH_API_URL = os.getenv('TELEGRAPH_API_URL', 'https://api.telegra.ph/')
+TELEGRAPH_RETRIES = int(os.getenv('TELEGRAPH_RETRIES', 5))
+TELEGRAPH_CONCURRENCY = int(os.getenv('TELEGRAPH_CONCURRENCY', 4))
+TELEGRAPH_TIMEOUT = float(os.getenv('TELEGRAPH_TIMEOUT', 30))
+MAX_FLOOD_WAIT = 120  # Longest FLOOD_WAIT/Retry-After honoured before giving up
+
+
+class TelegraphError(Exception):
+    pass
+
+
+class AsyncTelegraph:
+    """Telegraph API client on a pooled keep-alive aiohttp session.
+
+    FLOOD_WAIT_N errors and HTTP 429 are retried after the delay the
+    server asks for, 5xx and connection errors with exponential backoff.
+    `api_url` can point at a local stub server.
+    """
+
+    def __init__(self, access_token=None, api_url=TELEGRAPH_API_URL, retries=TELEGRAPH_RETRIES,
+                 concurrency=TELEGRAPH_CONCURRENCY):
+        self.access_token = access_token
+        self.api_url = api_url.rstrip("/") + "/"
+        self.retries = retries
+        self._slots = asyncio.Semaphore(concurrency)
+        self._session = None
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=TELEGRAPH_CONCURRENCY * 2, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=TELEGRAPH_TIMEOUT),
+            )
+        return self._session
+
+    async def method(self, name, values=None, path=""):
+        with request_seconds.time(method=name), tracer.span(f"telegraph.{name}"):
+            return await self._method(name, values, path)
+
+    async def _method(self, name, values, path):
+        values = {key: value for key, value in (values or {}).items() if value is not None}
+        if self.access_token and "access_token" not in values:
+            values["access_token"] = self.access_token
+        url = f"{self.api_url}{name}/{path}" if path else f"{self.api_url}{name}"
+        for attempt in range(self.retries + 1):
+            delay = None
+            try:
+                async with self._slots, self._get_session().post(url, data=values) as response:
+                    if response.status == 429:
+                        delay = float(response.headers.get("Retry-After", 2 ** attempt))
+                        error = "HTTP 429"
+                    elif response.status >= 500:
+                        error = f"HTTP {response.status}"
+                    else:
+                        body = await response.json(content_type=None)
+                        if body.get("ok"):
+                            return body["result"]
+                        error = str(body.get("error"))
+                        if not error.startswith("FLOOD_WAIT_"):
+                            raise TelegraphError(error)
+                        delay = float(error.rsplit("_", 1)[-1])
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = repr(e)
+            if attempt == self.retries or (delay is not None and delay > MAX_FLOOD_WAIT):
+                raise TelegraphError(f"{name} failed: {error}")
+            if delay is None:
+                delay = 2 ** attempt * (1 + random.random())
+            retries_total.inc(method=name)
+            tracer.current().set(retries=attempt + 1)
+            logger.warning(f"Telegraph {name} failed ({error}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    async def create_account(self, short_name, author_name=None, author_url=None):
+        result = await self.method("createAccount", {
+            "short_name": short_name, "author_name": author_name, "author_url": author_url,
+        })
+        self.access_token = result["access_token"]
+        return result
+
+    def get_access_token(self):
+        return self.access_token
+
+    async def create_page(self, title, content, author_name=None, author_url=None, return_content=False):
+        return await self.method("createPage", {
+            "title": title,
+            "author_name": author_name,
+            "author_url": author_url,
+            "content": json.dumps(content, ensure_ascii=False, separators=(",", ":")),
+            "return_content": str(return_content).lower(),
+        })
+
+    async def create_pages(self, pages):
+        """Create several `(title, content)` pages concurrently, within the client's concurrency limit."""
+        return await asyncio.gather(*(self.create_page(title, content) for title, content in pages))
+
+    async def edit_page(self, path, title, content, author_name=None, author_url=None, return_content=False):
+        return await self.method("editPage", {
+            "title": title,
+            "author_name": author_name,
+            "author_url": author_url,
+            "content": json.dumps(content, ensure_ascii=False, separators=(",", ":")),
+            "return_content": str(return_content).lower(),
+        }, path=path)
+
+    async def get_page(self, path, return_content=True):
+        return await self.method("getPage", {"return_content": str(return_content).lower()}, path=path)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
@@ -0,0 +1,141 @@
+import re
+import time
+import logging
+from collections import deque
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+phase_seconds = metrics.histogram("job_phase_seconds", "Duration of /fetch job phases (resolve, download, thumbnail, upload, stream)")
+
+SPEED_WINDOW = 5.0  # Seconds of samples the speed is averaged over
+
+UNITS = {"B": 1, "KiB": 1024, "MiB": 1024 ** 2, "GiB": 1024 ** 3, "TiB": 1024 ** 4,
+         "KB": 1000, "MB": 1000 ** 2, "GB": 1000 ** 3, "TB": 1000 ** 4}
+SIZE = r"([\d.]+)\s*([KMGT]?i?B)"
+# [download]  45.3% of ~ 50.00MiB at  2.00MiB/s ETA 00:20
+YTDLP_PROGRESS = re.compile(r"\[download\]\s+([\d.]+)% of\s+~?\s*" + SIZE)
+# [#2089b0 400.0KiB/33.2MiB(1%) CN:1 DL:115.7KiB ETA:4m51s]
+ARIA2_PROGRESS = re.compile(r"\[#\w+\s+" + SIZE + "/" + SIZE + r"\(")
+
+
+def to_bytes(value, unit):
+    return int(float(value) * UNITS.get(unit, 1))
+
+
+def parse_progress(line):
+    """`(done_bytes, total_bytes)` from a yt-dlp or aria2c progress line, or None."""
+    match = ARIA2_PROGRESS.search(line)
+    if match:
+        return to_bytes(*match.group(1, 2)), to_bytes(*match.group(3, 4))
+    match = YTDLP_PROGRESS.search(line)
+    if match:
+        total = to_bytes(*match.group(2, 3))
+        return int(total * float(match.group(1)) / 100), total
+    return None
+
+
+class TransferTracker:
+    """Bytes/s, ETA and per-phase durations of one transfer (e.g. a /fetch job).
+
+    `phase()` starts a new phase and resets the byte counters; the speed is
+    averaged over the last SPEED_WINDOW seconds of `update()` samples.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.phases = {}
+        self.phase_name = None
+        self.done = 0
+        self.total = None
+        self._phase_started = None
+        self._samples = deque()
+
+    def phase(self, name):
+        self._end_phase()
+        self.phase_name = name
+        self._phase_started = time.monotonic()
+        self.done, self.total = 0, None
+        self._samples.clear()
+
+    def _end_phase(self):
+        if self.phase_name is not None:
+            self.phases[self.phase_name] = self.phases.get(self.phase_name, 0) + time.monotonic() - self._phase_started
+            self.phase_name = None
+
+    def update(self, done, total=None):
+        now = time.monotonic()
+        self.done = done
+        self.total = total or self.total
+        self._samples.append((now, done))
+        while len(self._samples) > 2 and now - self._samples[0][0] > SPEED_WINDOW:
+            self._samples.popleft()
+
+    @property
+    def speed(self):
+        if len(self._samples) < 2:
+            return None
+        (start, first), (end, last) = self._samples[0], self._samples[-1]
+        return (last - first) / (end - start) if end > start else None
+
+    @property
+    def percent(self):
+        return self.done * 100 / self.total if self.total else None
+
+    @property
+    def eta(self):
+        speed = self.speed
+        return (self.total - self.done) / speed if self.total and speed else None
+
+    def finish(self):
+        self._end_phase()
+        phases = ", ".join(f"{name} {seconds:.1f}s" for name, seconds in self.phases.items())
+        logger.info(f"Transfer {self.name} finished ({phases})")
+        return self.phases
+
+    def snapshot(self):
+        return {
+            "name": self.name,
+            "phase": self.phase_name,
+            "done": self.done,
+            "total": self.total,
+            "percent": self.percent,
+            "speed": self.speed,
+            "eta": self.eta,
+            "phases": dict(self.phases),
+        }
+
+
+class TransferRegistry:
+    """Trackers of the transfers in progress, and totals of finished ones, for metrics."""
+
+    def __init__(self):
+        self.active = {}
+        self.finished = 0
+        self.phase_totals = {}
+
+    def start(self, name):
+        tracker = self.active[name] = TransferTracker(name)
+        return tracker
+
+    def get(self, name):
+        return self.active.get(name) or self.start(name)
+
+    def finish(self, name):
+        tracker = self.active.pop(name, None)
+        if tracker is None:
+            return
+        for phase, seconds in tracker.finish().items():
+            self.phase_totals[phase] = self.phase_totals.get(phase, 0) + seconds
+            phase_seconds.observe(seconds, phase=phase)
+        self.finished += 1
+
+    def snapshot(self):
+        return {
+            "active": [tracker.snapshot() for tracker in self.active.values()],
+            "finished": self.finished,
+            "phase_seconds": dict(self.phase_totals),
+        }
+
+
+transfers = TransferRegistry()
@@ -0,0 +1,399 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+logger = logging.getLogger(__name__)
+
+TRACE_EXPORT = os.getenv('TRACE_EXPORT', 'jsonl')  # jsonl, otlp or off
+TRACE_PATH = os.getenv('TRACE_PATH', os.path.join(os.getcwd(), 'crawler_cache', 'traces.jsonl'))
+TRACE_MAX_BYTES = int(os.getenv('TRACE_MAX_BYTES', 20 * 1024 * 1024))  # Rotated to traces.jsonl.1 beyond this
+OTLP_ENDPOINT = os.getenv('OTLP_ENDPOINT', 'http://127.0.0.1:4318')
+TRACE_KEEP = int(os.getenv('TRACE_KEEP', 100))  # Recent traces kept in memory for /trace
+SERVICE_NAME = "crawl4tg"
+
+_current = ContextVar("current_span", default=None)
+
+
+class Span:
+    """One timed operation of a trace. `set()` adds attributes while it runs."""
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "attributes", "start", "duration", "error", "_started")
+
+    def __init__(self, name, trace_id, parent_id=None, attributes=None):
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = {key: value for key, value in (attributes or {}).items() if value is not None}
+        self.start = time.time()
+        self.duration = None
+        self.error = None
+        self._started = time.perf_counter()
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def finish(self):
+        self.duration = time.perf_counter() - self._started
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration": self.duration,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+class _NoSpan:
+    """Handed out for spans started outside any trace, which are not recorded."""
+    trace_id = None
+
+    def set(self, **attributes):
+        pass
+
+
+NO_SPAN = _NoSpan()
+
+
+class JsonlExporter:
+    """Appends finished spans to a JSONL file, one span per line."""
+
+    def __init__(self, path=TRACE_PATH, max_bytes=TRACE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def export(self, spans):
+        lines = "".join(json.dumps(span, ensure_ascii=False) + "\n" for span in spans)
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            if os.path.exists(self.path) and os.path.getsize(self.path) > self.max_bytes:
+                os.replace(self.path, self.path + ".1")
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(lines)
+
+    def load(self, match):
+        """Spans from the file (newest file last) for which `match(span)` is true."""
+        spans = []
+        with self._lock:
+            for path in (self.path + ".1", self.path):
+                if not os.path.exists(path):
+                    continue
+                with open(path, encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            span = json.loads(line)
+                        except ValueError:
+                            continue
+                        if match(span):
+                            spans.append(span)
+        return spans
+
+    async def close(self):
+        pass
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _from_otlp_value(value):
+    if "intValue" in value:
+        return int(value["intValue"])
+    return next(iter(value.values()), None)
+
+
+def to_otlp(spans):
+    """OTLP/HTTP JSON request body for a list of span dicts."""
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+        "scopeSpans": [{
+            "scope": {"name": SERVICE_NAME},
+            "spans": [{
+                "traceId": span["trace_id"],
+                "spanId": span["span_id"],
+                "parentSpanId": span["parent_id"] or "",
+                "name": span["name"],
+                "kind": 1,
+                "startTimeUnixNano": str(int(span["start"] * 1e9)),
+                "endTimeUnixNano": str(int((span["start"] + span["duration"]) * 1e9)),
+                "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in span["attributes"].items()],
+                "status": {"code": 2, "message": span["error"]} if span["error"] else {"code": 1},
+            } for span in spans],
+        }],
+    }]}
+
+
+def from_otlp(body):
+    """Span dicts from an OTLP/HTTP JSON request body (the inverse of `to_otlp`)."""
+    for resource in body.get("resourceSpans", []):
+        for scope in resource.get("scopeSpans", []):
+            for span in scope.get("spans", []):
+                start, end = int(span["startTimeUnixNano"]) / 1e9, int(span["endTimeUnixNano"]) / 1e9
+                status = span.get("status", {})
+                yield {
+                    "trace_id": span["traceId"],
+                    "span_id": span["spanId"],
+                    "parent_id": span.get("parentSpanId") or None,
+                    "name": span["name"],
+                    "start": start,
+                    "duration": end - start,
+                    "error": status.get("message") if status.get("code") == 2 else None,
+                    "attributes": {
+                        attribute["key"]: _from_otlp_value(attribute["value"])
+                        for attribute in span.get("attributes", [])
+                    },
+                }
+
+
+class OtlpExporter:
+    """Posts finished spans to an OTLP/HTTP collector (`{endpoint}/v1/traces`, JSON encoding) in the background."""
+
+    def __init__(self, endpoint=OTLP_ENDPOINT):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self._session = None
+        self._tasks = set()
+
+    def export(self, spans):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        task = loop.create_task(self._post(spans))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _post(self, spans):
+        import aiohttp
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10))
+        try:
+            async with self._session.post(self.url, json=to_otlp(spans)) as response:
+                if response.status >= 400:
+                    logger.warning(f"Trace collector answered HTTP {response.status}")
+        except Exception as e:
+            logger.warning(f"Could not export {len(spans)} spans to {self.url}: {e!r}")
+
+    def load(self, match):
+        return []
+
+    async def close(self):
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+class Tracer:
+    """Per-command traces made of nested spans.
+
+    `span(name, root=True)` starts a trace; spans opened while it runs
+    (in the same task or tasks created from it) become its children.
+    Spans opened outside any trace are not recorded, so instrumented code
+    costs next to nothing when nothing traces it. A trace is exported when
+    its root span ends; spans that end later are exported on their own.
+    The last TRACE_KEEP traces stay in memory for `/trace`.
+    """
+
+    def __init__(self, exporter=None, keep=TRACE_KEEP):
+        self.exporter = exporter
+        self.keep = keep
+        self.traces = OrderedDict()  # trace_id -> {"spans": [...], "done": bool}
+
+    @contextmanager
+    def span(self, name, root=False, **attributes):
+        parent = None if root else _current.get()
+        if parent is None and not root:
+            yield NO_SPAN
+            return
+        span = Span(name, parent.trace_id if parent else os.urandom(16).hex(), parent and parent.span_id, attributes)
+        token = _current.set(span)
+        try:
+            yield span
+        except asyncio.CancelledError:
+            span.error = "cancelled"
+            raise
+        except BaseException as e:
+            span.error = repr(e)
+            raise
+        finally:
+            span.finish()
+            _current.reset(token)
+            self._record(span)
+
+    def current(self):
+        return _current.get() or NO_SPAN
+
+    def _record(self, span):
+        trace = self.traces.get(span.trace_id)
+        if trace is None:
+            trace = self.traces[span.trace_id] = {"spans": [], "done": False}
+            while len(self.traces) > self.keep:
+                self.traces.popitem(last=False)
+        data = span.to_dict()
+        trace["spans"].append(data)
+        if span.parent_id is None:
+            trace["done"] = True
+            self._export(trace["spans"])
+        elif trace["done"]:
+            self._export([data])
+
+    def _export(self, spans):
+        if self.exporter is None:
+            return
+        try:
+            self.exporter.export(spans)
+        except Exception as e:
+            logger.warning(f"Could not export spans: {e}")
+
+    def recent(self, limit=10):
+        """Root spans of the latest finished traces, newest first."""
+        roots = [span for trace in self.traces.values() for span in trace["spans"] if span["parent_id"] is None]
+        return roots[::-1][:limit]
+
+    async def find(self, key):
+        """Spans of the trace whose id starts with `key` or whose root has `job=key`, newest trace first."""
+        def match(span):
+            return span["trace_id"].startswith(key) or (
+                span["parent_id"] is None and span["attributes"].get("job") == key
+            )
+
+        # Recent traces change as spans finish on the loop, so they are searched here; only the file is read in a thread
+        for trace_id, trace in reversed(self.traces.items()):
+            if any(match(span) for span in trace["spans"]):
+                return list(trace["spans"])
+        if self.exporter is None:
+            return []
+        return await asyncio.to_thread(self._load, match)
+
+    def _load(self, match):
+        found = self.exporter.load(match)
+        if not found:
+            return []
+        trace_id = found[-1]["trace_id"]
+        return self.exporter.load(lambda span: span["trace_id"] == trace_id)
+
+    async def close(self):
+        if self.exporter is not None:
+            await self.exporter.close()
+
+
+def _end(span):
+    return span["start"] + span["duration"]
+
+
+def critical_path(span, children, depth=0):
+    """`(depth, span)` pairs on the critical path below `span`, in time order.
+
+    Working back from the end of a span: the child that finished last,
+    then the last one to finish before that child started, and so on.
+    """
+    chain, cursor = [], _end(span)
+    for child in sorted(children.get(span["span_id"], ()), key=_end, reverse=True):
+        if _end(child) <= cursor + 1e-6:
+            chain.append(child)
+            cursor = child["start"]
+    path = [(depth, span)]
+    for child in reversed(chain):
+        path.extend(critical_path(child, children, depth + 1))
+    return path
+
+
+def summarize(spans, limit=25):
+    """Text summary of one trace for Telegram: the critical path and the busiest span names."""
+    root = next((span for span in spans if span["parent_id"] is None), None)
+    if root is None:
+        return "⏳ That trace is still running."
+    children = {}
+    for span in spans:
+        children.setdefault(span["parent_id"], []).append(span)
+    status = f"failed: {root['error']}" if root["error"] else "ok"
+    attributes = " ".join(f"{key}={value}" for key, value in root["attributes"].items())
+    lines = [f"🧭 Trace {root['trace_id'][:8]} {root['name']} {root['duration']:.2f}s ({status})"]
+    if attributes:
+        lines.append(attributes)
+    lines.append(f"\nCritical path ({len(spans)} spans):")
+    path = critical_path(root, children)
+    for depth, span in path[:limit]:
+        share = span["duration"] / root["duration"] * 100 if root["duration"] else 0
+        error = " ❌" if span["error"] else ""
+        lines.append(f"{'  ' * depth}{span['duration']:.2f}s {share:.0f}% {span['name']}{error}")
+    if len(path) > limit:
+        lines.append(f"… {len(path) - limit} more")
+
+    stages = {}
+    for span in spans:
+        if span is root:
+            continue
+        count, total, longest = stages.get(span["name"], (0, 0, 0))
+        stages[span["name"]] = (count + 1, total + span["duration"], max(longest, span["duration"]))
+    if stages:
+        lines.append("\nBy span (count, busy time, longest):")
+        for name, (count, total, longest) in sorted(stages.items(), key=lambda item: -item[1][1])[:10]:
+            lines.append(f"{name}: {count}× {total:.2f}s max {longest:.2f}s")
+    return "\n".join(lines)
+
+
+def format_recent(roots):
+    if not roots:
+        return "No traces recorded yet."
+    lines = ["🧭 Recent traces:"]
+    for root in roots:
+        error = " ❌" if root["error"] else ""
+        job = f" job {root['attributes']['job']}" if "job" in root["attributes"] else ""
+        lines.append(f"{root['trace_id'][:8]} {root['name']}{job} {root['duration']:.2f}s{error}")
+    lines.append("\nUse /trace [id] for the critical path.")
+    return "\n".join(lines)
+
+
+def _exporter():
+    if TRACE_EXPORT == "jsonl":
+        return JsonlExporter()
+    if TRACE_EXPORT == "otlp":
+        return OtlpExporter()
+    return None
+
+
+tracer = Tracer(_exporter())
+
+
+async def collect(host="127.0.0.1", port=4318, path=TRACE_PATH):
+    """Minimal OTLP/HTTP JSON collector that appends received spans to `path` in the JSONL format."""
+    from aiohttp import web
+    exporter = JsonlExporter(path)
+
+    async def receive(request):
+        exporter.export(list(from_otlp(await request.json())))
+        return web.json_response({})
+
+    app = web.Application()
+    app.router.add_post("/v1/traces", receive)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Collecting traces on http://{host}:{port}/v1/traces into {path}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    # python tracing.py [port]: run the collector stub for TRACE_EXPORT=otlp
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(collect(port=int(sys.argv[1]) if len(sys.argv) > 1 else 4318))
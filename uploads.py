@@ -0,0 +1,104 @@
+import os
+import time
+import hashlib
+import sqlite3
+import logging
+import threading
+from urllib.parse import urlsplit
+from cache import DB_PATH, normalize_url
+
+logger = logging.getLogger(__name__)
+
+
+def file_hash(path, chunk_size=1024 * 1024):
+    """SHA-256 of a file, read in chunks (run it in a thread for large videos)."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def video_code(url):
+    """Code of the video on a detail page: the page slug, e.g. `abc-123-uncensored-leak`.
+
+    The slug is the same across mirrors and languages of a page, and tells
+    variants of a video (uncensored leak, Chinese subtitles...) apart,
+    which the code in their titles doesn't.
+    """
+    return urlsplit(url.strip()).path.rstrip("/").rsplit("/", 1)[-1].lower() or None
+
+
+class UploadIndex:
+    """Maps source URL, video code and content hash to the Telegram file_id of an upload.
+
+    A video that was sent once can be sent again by file_id without
+    downloading or uploading it.
+    """
+
+    def __init__(self, db_path=DB_PATH):
+        self.db_path = db_path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.executescript('''
+                CREATE TABLE IF NOT EXISTS uploads (
+                    file_id TEXT NOT NULL,
+                    caption TEXT,
+                    source_url TEXT,
+                    code TEXT,
+                    content_hash TEXT,
+                    created_at REAL
+                );
+                CREATE INDEX IF NOT EXISTS uploads_source_url ON uploads (source_url);
+                CREATE INDEX IF NOT EXISTS uploads_code ON uploads (code);
+                CREATE INDEX IF NOT EXISTS uploads_content_hash ON uploads (content_hash);
+            ''')
+            self._conn.commit()
+        return self._conn
+
+    def find(self, source_url=None, code=None, content_hash=None):
+        """Return `(file_id, caption)` of the newest upload matching any of the given keys, or None."""
+        keys = {
+            "source_url": normalize_url(source_url) if source_url else None,
+            "code": code,
+            "content_hash": content_hash,
+        }
+        for column, value in keys.items():
+            if not value:
+                continue
+            try:
+                with self._lock:
+                    row = self._connect().execute(
+                        f"SELECT file_id, caption FROM uploads WHERE {column} = ? ORDER BY created_at DESC LIMIT 1",
+                        (value,)
+                    ).fetchone()
+            except sqlite3.Error as e:
+                logger.error(f"Upload index read error: {e}")
+                return None
+            if row:
+                return row
+        return None
+
+    def add(self, file_id, caption=None, source_url=None, code=None, content_hash=None):
+        try:
+            with self._lock:
+                conn = self._connect()
+                conn.execute(
+                    "INSERT INTO uploads (file_id, caption, source_url, code, content_hash, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        file_id,
+                        caption,
+                        normalize_url(source_url) if source_url else None,
+                        code,
+                        content_hash,
+                        time.time(),
+                    )
+                )
+                conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Upload index write error: {e}")
@@ -0,0 +1,96 @@
+"""Job worker: runs queued bot jobs outside the bot process.
+
+The bot (app.py) only queues jobs when it runs with JOB_WORKERS=0; start
+one or more of these next to it to crawl and download:
+
+    python worker.py --name w1 --workers 4
+    python worker.py --name dl --kinds fetch --workers 2
+
+Workers share the bot's crawler_cache database, so they have to run on
+the same host. Each reports back by editing the job's status message and
+recording the outcome on the job. Give each process on a host its own
+METRICS_PORT (or 0).
+"""
+import os
+import asyncio
+import logging
+import argparse
+from dotenv import load_dotenv
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Suppress Pyrogram logs
+logging.getLogger("pyrogram").setLevel(logging.WARNING)
+logging.getLogger("urllib3").setLevel(logging.WARNING)
+
+# Load environment variables
+load_dotenv()
+
+API_ID = os.getenv('TELEGRAM_API_ID')
+API_HASH = os.getenv('TELEGRAM_API_HASH')
+BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--name", default=os.getenv('WORKER_NAME', 'worker'),
+                        help="Worker name, unique per host; a restarted worker takes its jobs back")
+    parser.add_argument("--kinds", help="Comma-separated job kinds to run, e.g. fetch or miss,misstg (default: all)")
+    parser.add_argument("--workers", type=int, help="Jobs run at once (default: JOB_WORKERS)")
+    return parser.parse_args()
+
+
+async def main(args):
+    # Read when downloader is imported, so set before that
+    os.environ['WORKER_NAME'] = args.name
+    if args.workers is not None:
+        os.environ['JOB_WORKERS'] = str(args.workers)
+
+    from pyrogram import Client, idle
+    from resources import startup
+    from metrics import metrics_server
+    from tracing import tracer
+    from publish import publisher
+    from crawl import crawler_pool, shutdown as crawl_shutdown
+    from downloader import job_runner
+    from commands import JOB_HANDLERS
+
+    if not all([API_ID, API_HASH, BOT_TOKEN]):
+        raise ValueError("Missing Telegram bot credentials. Please set TELEGRAM_API_ID, TELEGRAM_API_HASH, and BOT_TOKEN in .env file")
+    kinds = [kind.strip() for kind in args.kinds.split(",")] if args.kinds else None
+    unknown = set(kinds or ()) - set(JOB_HANDLERS)
+    if unknown:
+        raise ValueError(f"Unknown job kinds: {', '.join(sorted(unknown))}")
+
+    # Sends and edits messages only; commands are received by the bot
+    client = Client(
+        f"worker_{args.name}",
+        api_id=int(API_ID),
+        api_hash=API_HASH,
+        bot_token=BOT_TOKEN,
+        no_updates=True
+    )
+    startup.mark("imports")
+    await client.start()
+    startup.mark("telegram")
+    await job_runner.start(client, JOB_HANDLERS, kinds)
+    startup.mark("jobs")
+    await metrics_server.start()
+    asyncio.create_task(crawler_pool.warm())
+    startup.report()
+    print(f"Worker {job_runner.worker_id} is running...")
+    try:
+        await idle()
+    finally:
+        await metrics_server.stop()
+        await job_runner.stop()
+        await client.stop()
+        await crawl_shutdown()
+        await publisher.close()
+        await tracer.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))